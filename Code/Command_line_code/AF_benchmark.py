@@ -0,0 +1,295 @@
+## Benchmarks for the Processing Pipeline
+
+### Import Necessary Packages
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import plotly.io
+
+from AF_report import _peak_rss
+from AF_scores import SCORES, calc_scores
+from AF_synthetic import generate_mimic
+
+
+### Row-wise reference implementations (the original per-admission score functions)
+def poaf(x):
+    poaf=0
+    if (60 <= x['age'] <= 69):
+        poaf=poaf+1
+    if (70 <= x['age'] <= 79):
+        poaf=poaf+2
+    if (x['age'] >= 80):
+        poaf=poaf+3
+    if (x['copd'] == 1):
+        poaf=poaf+1
+    if (x['eGFR'] < 15):
+        poaf=poaf+1
+    elif (x['dialysis'] == 1):
+        poaf=poaf+1
+    if (x['emergency'] == 1):
+        poaf=poaf+1
+    if (x['iabp'] == 1):
+        poaf=poaf+1
+    if (x['cvas'] == 1):
+        poaf=poaf+1
+    return poaf
+
+def chads(x):
+    chads=0
+    if (x['chf'] == 1):
+        chads=chads+1
+    if (x['hbp'] == 1):
+        chads=chads+1
+    if (x['age'] >= 75):
+        chads=chads+2
+    if (x['dm'] == 1):
+        chads=chads+1
+    if (x['stroke'] == 1):
+        chads=chads+2
+    if (x['pvd'] == 1):
+        chads=chads+1
+    if (65 <= x['age'] <= 74):
+        chads=chads+1
+    if (x['gender'] == 'F'):
+        chads=chads+1
+    return chads
+
+def afri(x):
+    afri=0
+    if (x['gender'] == 'M'):
+        if (x['age'] > 60):
+            afri=afri+1
+        if (x['weight'] > 76):
+            afri=afri+1
+        if (x['height'] > 176):
+            afri=afri+1
+        if (x['pvd'] == 1):
+            afri=afri+1
+    elif (x['gender'] == 'F'):
+        if (x['age'] > 66):
+            afri=afri+1
+        if (x['weight'] > 64):
+            afri=afri+1
+        if (x['height'] > 168):
+            afri=afri+1
+        if (x['pvd'] == 1):
+            afri=afri+1
+    return afri
+
+def npoaf(x):
+    npoaf=0
+    if (65 <= x['age'] <= 74):
+        npoaf=npoaf+2
+    if (x['age'] >= 75):
+        npoaf=npoaf+3
+    if (x['mmvd'] == 1):
+        npoaf=npoaf+1
+    if (x['smvd'] == 1):
+        npoaf=npoaf+3
+    if (x['lad'] == 1):
+        npoaf=npoaf+1
+    return npoaf
+
+def simplified(x):
+    simplified=0
+    if (x['age'] >= 65):
+        simplified=simplified+2
+    if (x['hbp'] == 1):
+        simplified=simplified+2
+    if (x['MI'] == 1):
+        simplified=simplified+1
+    if (x['chf'] == 1):
+        simplified=simplified+2
+    return simplified
+
+def comaf(x):
+    comaf=0
+    if (65 <= x['age'] <= 74):
+        comaf=comaf+1
+    if (x['age'] >= 75):
+        comaf=comaf+2
+    if (x['gender'] == 'F'):
+        comaf=comaf+1
+    if (x['hbp'] == 1):
+        comaf=comaf+1
+    if (x['dm'] == 1):
+        comaf=comaf+1
+    if (x['stroke'] == 1):
+        comaf=comaf+2
+    return comaf
+
+ROW_FUNCS = {'poaf': poaf, 'chads': chads, 'afri': afri,
+             'npoaf': npoaf, 'simplified': simplified, 'comaf': comaf}
+
+
+### Establish a function to create an indicators table shaped like the one built in AF_process_post_impute.py
+def make_indicators(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'subject_id': np.arange(n),
+        'hadm_id': np.arange(n) + 100000,
+        'height': rng.normal(170, 10, n).round(1),
+        'weight': rng.normal(80, 15, n).round(1),
+        'gender': rng.choice(['M', 'F'], n),
+        'age': rng.integers(18, 91, n),
+        'creatinine': rng.lognormal(0, 0.4, n).round(2),
+        'eGFR': rng.uniform(5, 120, n).round(1),
+    })
+    for col in ['chf', 'hbp', 'dm', 'stroke', 'vd', 'pvd', 'lad', 'copd', 'iabp',
+                'cvas', 'emergency', 'dialysis', 'MI', 'AF']:
+        df[col] = (rng.random(n) < 0.2).astype('int64')
+    mvd = rng.random(n) < 0.2
+    mild = rng.random(n) < 0.5
+    df['mmvd'] = (mvd & mild).astype('float64')
+    df['smvd'] = (mvd & ~mild).astype('float64')
+    # --> sprinkle in missing values so NaN handling is exercised too
+    for col in ['height', 'weight', 'eGFR']:
+        df.loc[rng.random(n) < 0.01, col] = np.nan
+    return df
+
+
+### Establish a function to benchmark the columnar score engine against the row-wise functions
+# --> the row-wise pass is timed on at most rowwise_max rows and extrapolated linearly beyond that,
+#     since six apply() passes over 10M rows take hours
+def bench_scores(sizes, rowwise_max=100000, seed=0):
+    results = []
+    for n in sizes:
+        df = make_indicators(n, seed)
+
+        start = time.perf_counter()
+        vec = calc_scores(df)
+        vec_time = time.perf_counter() - start
+
+        sample = df.iloc[:min(n, rowwise_max)]
+        start = time.perf_counter()
+        row = pd.DataFrame({name: sample.apply(ROW_FUNCS[name], axis=1) for name in SCORES})
+        row_time = (time.perf_counter() - start) * n / len(sample)
+
+        # --> the two engines must agree on every sampled admission
+        pd.testing.assert_frame_equal(vec.loc[sample.index], row, check_dtype=False)
+
+        results.append({'rows': n,
+                        'rowwise_s': round(row_time, 3),
+                        'rowwise_extrapolated': len(sample) < n,
+                        'columnar_s': round(vec_time, 3),
+                        'speedup': round(row_time / vec_time, 1)})
+    return pd.DataFrame(results)
+
+
+### Establish a function to time the dashboard callbacks against the reference dataset in the working directory
+# --> run in its own process (AF_benchmark.py --callbacks) so the memory it reports is the dashboard's alone
+# --> payload_mb is the size of the JSON the callback's output is sent to the browser as
+def bench_callbacks():
+    steps = []
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        wall = time.perf_counter() - start
+        payload = len(plotly.io.json.to_json_plotly(result)) / 1024**2
+        steps.append({'step': name, 'wall_seconds': round(wall, 4), 'payload_mb': round(payload, 3)})
+        return result
+
+    start = time.perf_counter()
+    import AF_dashboard as dashboard
+    steps.append({'step': 'import (reads risk)', 'wall_seconds': round(time.perf_counter() - start, 4),
+                  'payload_mb': None, 'rows': len(dashboard.default_data)})
+    scores = {score: 2 for score in dashboard.score_names}
+    lookup = timed('lookup_calc', dashboard.lookup_calc, None)
+    timed('percentile_calc', dashboard.percentile_calc, scores, lookup)
+    timed('comparison_figure', dashboard.comparison_figure, None, scores, 'afri', 'npoaf')
+    timed('comparison_figure (cached)', dashboard.comparison_figure, None, scores, 'afri', 'npoaf')
+    timed('comparison_figure (scores only)', dashboard.comparison_figure, None, scores, 'afri', 'npoaf', True)
+    cuts = [dashboard.CUT_POINTS[score] for score in dashboard.score_names]
+    for score in dashboard.score_names:
+        timed(f'score_val {score}', dashboard.score_val, None, score + '-tab', *cuts)
+        timed(f'roc_val {score}', dashboard.roc_val, None, score + '-tab', *cuts)
+        timed(f'afri_val {score}', dashboard.afri_val, None, score + '-tab')
+    return {'peak_rss_mb': _peak_rss(), 'steps': steps}
+
+
+### Establish a function to read the newest run report a script wrote under report_dir
+def _latest_report(report_dir, script):
+    paths = sorted(glob.glob(os.path.join(report_dir, script + '-*.json')), key=os.path.getmtime)
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
+### Establish a function to benchmark the whole pipeline and the dashboard on synthetic data of each size
+# --> for each size, writes a synthetic dataset under workdir/<size> (see AF_synthetic.py), then runs
+#     AF_process.py (with its imputation), AF_process_post_impute.py and the dashboard callbacks there with an
+#     empty stage cache, each in its own process
+# --> returns one row per stage and callback with its time and memory, taken from the scripts' run reports
+#     (AF_report.py); peak_rss_mb is the peak of the whole process the step ran in
+# --> callbacks_max skips the dashboard above that many admissions (None runs it at every size)
+def bench_pipeline(sizes, workdir, seed=0, hours=6, callbacks_max=None, keep=False):
+    here = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    for n in sizes:
+        root = os.path.join(workdir, str(n))
+        cwd = os.path.join(root, 'Code', 'Command_line_code')
+        start = time.perf_counter()
+        generate_mimic(root, n, seed=seed, hours=hours)
+        rows.append({'admissions': n, 'script': 'AF_synthetic', 'step': 'generate_mimic', 'stage': None,
+                     'wall_seconds': round(time.perf_counter() - start, 3)})
+        shutil.rmtree(os.path.join(root, 'Data', 'cache'), ignore_errors=True)
+        report_dir = os.path.join(root, 'Data', 'reports')
+
+        for script in ['AF_process', 'AF_process_post_impute']:
+            subprocess.run([sys.executable, os.path.join(here, script + '.py')], cwd=cwd, check=True)
+            report = _latest_report(report_dir, script)
+            for step in report['steps']:
+                rows.append({'admissions': n, 'script': script, 'step': step['step'], 'stage': step['stage'],
+                             'wall_seconds': step['wall_seconds'], 'cpu_seconds': step['cpu_seconds'],
+                             'rss_before_mb': step['rss_before_mb'], 'rss_after_mb': step['rss_after_mb'],
+                             'peak_rss_delta_mb': step['peak_rss_delta_mb'], 'table_mb_out': step['table_mb_out'],
+                             'rows_out': step['rows_out']})
+            rows.append({'admissions': n, 'script': script, 'step': 'total', 'stage': None,
+                         'wall_seconds': report['wall_seconds'], 'peak_rss_mb': report['peak_rss_mb']})
+
+        if callbacks_max is None or n <= callbacks_max:
+            out = subprocess.run([sys.executable, os.path.join(here, 'AF_benchmark.py'), '--callbacks'], cwd=cwd,
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            for step in result['steps']:
+                rows.append({'admissions': n, 'script': 'AF_dashboard', 'stage': None, **step})
+            rows.append({'admissions': n, 'script': 'AF_dashboard', 'step': 'total', 'stage': None,
+                         'peak_rss_mb': result['peak_rss_mb']})
+        if not keep:
+            shutil.rmtree(root)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the AF risk score pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help='rows (admissions with --pipeline); default 10k, 1M, 10M (10k, 100k, 1M, 10M with --pipeline)')
+    parser.add_argument('--rowwise-max', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pipeline', action='store_true',
+                        help='benchmark the whole pipeline and the dashboard on synthetic data instead of the scores')
+    parser.add_argument('--workdir', default='../../Data/benchmark', help='where the synthetic datasets are written')
+    parser.add_argument('--hours', type=int, default=6, help='longest synthetic ICU stay in hours')
+    parser.add_argument('--callbacks-max', type=int, default=None,
+                        help='skip the dashboard callbacks above this many admissions')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic datasets and outputs')
+    parser.add_argument('--output', default=None, help='also write the results to this csv')
+    parser.add_argument('--callbacks', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.callbacks:
+        print(json.dumps(bench_callbacks(), default=str))
+    elif args.pipeline:
+        results = bench_pipeline(args.sizes or [10000, 100000, 1000000, 10000000], args.workdir, args.seed, args.hours, args.callbacks_max, args.keep)
+        print(results.to_string(index=False))
+        if args.output is not None:
+            results.to_csv(args.output, index=False)
+    else:
+        print(bench_scores(args.sizes or [10000, 1000000, 10000000], args.rowwise_max, args.seed).to_string(index=False))
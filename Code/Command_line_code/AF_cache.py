@@ -0,0 +1,136 @@
+## On-disk Cache for the Processing Stages
+
+### Import Necessary Packages
+import hashlib
+import inspect
+import marshal
+import os
+import threading
+import types
+import pandas as pd
+
+from AF_report import enter_stage, exit_stage, record, snapshot
+
+
+### Establish a function to add a stage input to a running hash
+# --> dataframes are hashed by content, paths of existing files by size and modification time, and anything
+#     else by its repr
+def _update(h, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        h.update(repr([(str(col), str(dtype)) for col, dtype in frame.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    elif isinstance(value, str) and os.path.isfile(value):
+        stat = os.stat(value)
+        h.update(repr((os.path.abspath(value), stat.st_size, stat.st_mtime_ns)).encode())
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            _update(h, key)
+            _update(h, value[key])
+    else:
+        h.update(repr(value).encode())
+
+
+### Establish a function to collect the code a stage function depends on
+# --> the stage function's own source, the source of functions it calls from the same file, the whole source of
+#     the repository modules it uses (AF_indicators.py, AF_notes.py, ...), and the values of constants it reads,
+#     so editing an indicator's code list or a helper invalidates the stages that use it and no others
+# --> functions without a source file (typed into a console) are hashed by their compiled code instead
+def _code(func, parts, seen):
+    if func in seen:
+        return
+    seen.add(func)
+    try:
+        parts.append(inspect.getsource(func))
+        here = os.path.dirname(os.path.abspath(inspect.getsourcefile(func)))
+    except (OSError, TypeError):
+        parts.append(marshal.dumps(func.__code__))
+        here = None
+    code_objects = [func.__code__]
+    while code_objects:
+        code = code_objects.pop()
+        code_objects.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        for name in code.co_names:
+            if name not in func.__globals__:
+                continue
+            value = func.__globals__[name]
+            module = value if isinstance(value, types.ModuleType) else inspect.getmodule(value)
+            source = getattr(module, '__file__', None)
+            if isinstance(value, types.FunctionType) and value.__globals__ is func.__globals__:
+                _code(value, parts, seen)
+            elif source and os.path.dirname(os.path.abspath(source)) == here:
+                if module not in seen:
+                    seen.add(module)
+                    parts.append(inspect.getsource(module))
+            elif isinstance(value, (dict, list, tuple, str, int, float, bool)):
+                parts.append(repr(value))
+
+
+### Establish a function to compute the cache key of a stage
+def stage_key(name, func, args):
+    h = hashlib.blake2b(digest_size=16)
+    parts = []
+    _code(func, parts, set())
+    _update(h, [name, parts])
+    _update(h, list(args))
+    return h.hexdigest()
+
+
+### Establish a function to remove the least recently used cache entries once the cache exceeds max_bytes
+# --> keep is the entry just written, which is never removed; suffix picks the kind of entry (stage outputs are parquet)
+# --> entries removed meanwhile by a stage running in another thread or process are skipped
+def evict(cache_dir, max_bytes, keep=None, suffix='.parquet'):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            try:
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                continue
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path != keep:
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+### Establish a function to run one named stage of the pipeline through the cache
+# --> returns func(*args), loading it from cache_dir when the stage was already run with the same inputs and code;
+#     cache_dir None runs the stage without caching
+# --> stages return a dataframe, which is stored as parquet (index and column types are kept)
+# --> every stage is recorded in the run report (see AF_report.py), with cached telling whether it was loaded
+def run_stage(name, func, args, cache_dir=None, max_bytes=2 * 1024**3):
+    before = snapshot()
+    previous = enter_stage(name)
+    try:
+        result, cached = _cached_call(name, func, args, cache_dir, max_bytes)
+    finally:
+        exit_stage(previous)
+    record(name, before, args, result, cached=cached)
+    return result
+
+
+def _cached_call(name, func, args, cache_dir, max_bytes):
+    if cache_dir is None:
+        return func(*args), False
+    path = os.path.join(cache_dir, f'{name}-{stage_key(name, func, args)}.parquet')
+    if os.path.exists(path):
+        # --> mark the entry as recently used for eviction
+        os.utime(path)
+        return pd.read_parquet(path), True
+    result = func(*args)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    result.to_parquet(tmp)
+    os.replace(tmp, path)
+    evict(cache_dir, max_bytes, keep=path)
+    return result, False
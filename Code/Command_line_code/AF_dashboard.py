@@ -8,9 +8,14 @@ import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
 import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
-import statsmodels.api as sm
+import functools
+import math
+import threading
+from collections import OrderedDict
+
+from AF_scores import CUT_POINTS, SCORE_MAX, patient_scores, percentile
+from AF_io import RISK_SCHEMA, read_table
+from AF_reference import cached_reference_stats, cut_metrics, pair_counts, store_upload, upload_data, upload_on_disk
 
 
 ### Define the app and set the style guide
@@ -20,6 +25,28 @@ external_stylesheets = [dbc.themes.LUX]
 #### Define the app
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets, assets_external_path='assets')
 
+#### Set to True to calculate the patient scores and percentiles in the browser (see assets/AF_scores.js)
+#### so that a Calculate click needs no request to the server
+clientside_scoring = False
+
+#### Directory where the statistics of each reference dataset are kept between restarts (None keeps them in memory
+#### only) and its size limit in bytes (see AF_reference.py)
+reference_cache_dir = '../../Data/cache/reference'
+reference_cache_max_bytes = 64 * 1024**2
+
+#### Directory where uploaded reference datasets are stored (None keeps them in memory only), the memory in bytes the
+#### parsed uploads may take, and the size limit of the directory in bytes; the least recently used are dropped first
+upload_cache_dir = '../../Data/cache/uploads'
+upload_max_bytes = 512 * 1024**2
+upload_cache_max_bytes = 2 * 1024**3
+
+#### Reference datasets with more rows than this are drawn on the comparison graph as one bubble per pair of scores
+#### and AF outcome, sized by the number of patients, since a point per patient is too much for the browser
+strip_max_rows = 50000
+
+#### Number of comparison graphs (one per reference dataset and pair of axes) kept in memory for reuse
+strip_cache_entries = 32
+
 ### App Features
 #### Add the text for the hover tooltips
 #Dataset specification requirements explanation
@@ -122,6 +149,7 @@ upload = html.Div([
         # Prevent multiple files from being uploaded
         multiple=False
     ),
+    html.P(id='upload-status', style={'margin': '0px 10px', 'color': 'slateblue'}),
     dbc.Tooltip(
         upload_tip,
         target='upload-data',
@@ -130,7 +158,7 @@ upload = html.Div([
     )
 ])
 
-#### Store the data locally
+#### Store the token of the uploaded reference dataset (the dataset itself stays on the server)
 store_data = dcc.Store(id='input-dataset', storage_type='local')
 
 
@@ -243,13 +271,15 @@ calculate_button = html.Div(
     style={'margin-left' : '10px ', 'margin-top': '10px', 'margin-bottom': '10px'}
 )
 
-#### Store the calculated values locally
-afri_state = dcc.Store(id='afri-state', storage_type='local')
-chads_state = dcc.Store(id='chads-state', storage_type='local')
-poaf_state = dcc.Store(id='poaf-state', storage_type='local')
-npoaf_state = dcc.Store(id='npoaf-state', storage_type='local')
-simplified_state = dcc.Store(id='simplified-state', storage_type='local')
-comaf_state = dcc.Store(id='comaf-state', storage_type='local')
+#### Store the calculated values locally (one dictionary holding all six scores)
+scores_state = dcc.Store(id='scores-state', storage_type='local')
+
+#### Store the percentile lookup for the reference dataset and the strip chart without the patient marker
+reference_lookup = dcc.Store(id='reference-lookup')
+stripchart_base = dcc.Store(id='stripchart-base')
+
+#### Store which reference dataset and axes the strip chart on the page was drawn for, and its number of traces
+stripchart_drawn = dcc.Store(id='stripchart-drawn')
 
 #### Create display cards for the calculated risk scores 
 ### --> AFRI Card
@@ -526,13 +556,26 @@ minicards = html.Div([
 ], style={'margin-top': '10px','margin-left': '10px'})
 
 
+#### Establish a function for the cut-point slider of a score tab (from 0 to the highest score possible)
+def cut_slider(score):
+    top = SCORE_MAX[score]
+    return html.Div([
+        html.P("Cut Point:", style={'margin-bottom': '0px'}),
+        dcc.Slider(id=score + '-cut', min=0, max=top, step=1, value=CUT_POINTS[score],
+                   marks={i: str(i) for i in range(top + 1)})
+    ], style={'padding-left': '16px', 'padding-right': '16px'})
+
 #### Create a tab for AFRI results 
 # --> AFRI results card and tab format
 ### --> output the results on a card
 card_afri = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="afri-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="afri-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('afri'),
+                html.Div(id="afri-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -541,6 +584,7 @@ card_afri = html.Div([
 ### --> establish the format for the AFRI tab
 afri_tab = html.Div([
     html.Div(id="afri-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="afri-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_afri
 ])
 
@@ -551,7 +595,11 @@ afri_tab = html.Div([
 card_chads = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="chads-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="chads-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('chads'),
+                html.Div(id="chads-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -560,6 +608,7 @@ card_chads = html.Div([
 ### --> establish the format for the CHADS tab
 chads_tab = html.Div([
     html.Div(id="chads-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="chads-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_chads
 ])
 
@@ -569,7 +618,11 @@ chads_tab = html.Div([
 card_poaf = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="poaf-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="poaf-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('poaf'),
+                html.Div(id="poaf-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -578,6 +631,7 @@ card_poaf = html.Div([
 ### --> establish the format for the POAF tab
 poaf_tab = html.Div([
     html.Div(id="poaf-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="poaf-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_poaf
 ])
 
@@ -587,7 +641,11 @@ poaf_tab = html.Div([
 card_npoaf = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="npoaf-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="npoaf-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('npoaf'),
+                html.Div(id="npoaf-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -596,6 +654,7 @@ card_npoaf = html.Div([
 ### --> establish the format for the NPOAF tab
 npoaf_tab = html.Div([
     html.Div(id="npoaf-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="npoaf-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_npoaf
 ])
 
@@ -605,7 +664,11 @@ npoaf_tab = html.Div([
 card_simplified = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="simplified-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="simplified-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('simplified'),
+                html.Div(id="simplified-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -614,6 +677,7 @@ card_simplified = html.Div([
 ### --> establish the format for the Simplified tab
 simplified_tab = html.Div([
     html.Div(id="simplified-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="simplified-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_simplified
 ])
 
@@ -623,7 +687,11 @@ simplified_tab = html.Div([
 card_comaf = html.Div([
     dbc.Row([
         dbc.Col([
-            dbc.Card(id="comaf-val", style={'margin-right': '10px', 'margin-bottom': '10px'})
+            dbc.Card([
+                dbc.CardBody(html.P(id="comaf-percentile"), style={'padding-bottom': '0px'}),
+                cut_slider('comaf'),
+                html.Div(id="comaf-val")
+            ], style={'margin-right': '10px', 'margin-bottom': '10px'})
         ], 
         width=10)
     ],
@@ -632,6 +700,7 @@ card_comaf = html.Div([
 ### --> establish the format for the COM-AF tab
 comaf_tab = html.Div([
     html.Div(id="comaf-hist", style={'margin-right': '10px', 'margin-bottom': '10px'}),
+    html.Div(id="comaf-roc", style={'margin-right': '10px', 'margin-bottom': '10px'}),
     card_comaf
 ])
 
@@ -689,403 +758,211 @@ app.layout = html.Div(
             ]
         ),
         store_data,
-        afri_state,
-        chads_state,
-        poaf_state,
-        npoaf_state,
-        simplified_state,
-        comaf_state
+        scores_state,
+        reference_lookup,
+        stripchart_base,
+        stripchart_drawn
     ],
     style={'background-color': '#EEF3F8'}
 )
 
 
 ### App Callbacks and Configuration
-#### Establish a function for the input dataset
-default_data = pd.read_csv('../../Data/risk.csv')
-
-def parse_contents(contents, filename, date):
-    content_type, content_string = contents.split(',')
-
-    decoded = base64.b64decode(content_string)
-    try:
-        if 'csv' in filename:
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(
-                io.StringIO(decoded.decode('utf-8')))
-        elif 'xls' in filename:
-            # Assume that the user uploaded an excel file
-            df = pd.read_excel(io.BytesIO(decoded))
-        return df
-    except Exception as e:
-        print(e)
-
-#### Establish a callback for AFRI Calculation
-@app.callback(
-    [
-        dash.dependencies.Output('afri-card', 'children'),
-        dash.dependencies.Output('afri-card', 'style'),
-        dash.dependencies.Output('afri-mini', 'children'),
-        dash.dependencies.Output('afri-mini', 'style'),
-        dash.dependencies.Output('afri-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
-    ],
-)
-def afri_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
-    ctx = dash.callback_context
-    changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if ('submit-button' in changed_id):
-        afri=0
-        if (gender_state=='M'):
-            if (age_state > 60):
-                afri=afri+1
-            if (weight_state > 76):
-                afri=afri+1
-            if (height_state > 176):
-                afri=afri+1
-            if ('pvd' in conditions_state):
-                afri=afri+1
-        elif (gender_state == 'F'):
-            if (age_state > 66):
-                afri=afri+1
-            if (weight_state > 64):
-                afri=afri+1
-            if (height_state > 169):
-                afri=afri+1
-            if ('pvd' in conditions_state):
-                afri=afri+1              
-    else: 
-        afri=None
-    afri2 = afri
-    afri3 = afri
-    if afri==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif afri>=2:
-        style={'textAlign': 'center', 'color':'crimson'}
-    else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return afri, style, afri2, style2, afri3
-
-
-#### Establish a callback for CHADS Calculation
-@app.callback(
-    [
-        dash.dependencies.Output('chads-card', 'children'),
-        dash.dependencies.Output('chads-card', 'style'),
-        dash.dependencies.Output('chads-mini', 'children'),
-        dash.dependencies.Output('chads-mini', 'style'),
-        dash.dependencies.Output('chads-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
-    ],
-)
-def chads_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
-    ctx = dash.callback_context
-    changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if ('submit-button' in changed_id):
-        chads=0
-        if ('chf' in conditions_state):
-            chads=chads+1
-        if ('hbp' in conditions_state):
-            chads=chads+1
-        if (age_state >= 75):
-            chads=chads+2
-        if ('dm' in conditions_state):
-            chads=chads+1
-        if ('stroke' in conditions_state):
-            chads=chads+2
-        if ('pvd' in conditions_state):
-            chads=chads+1
-        if (65 <= age_state <= 74):
-            chads=chads+1
-        if (gender_state == 'F'):
-            chads=chads+1
-    else: 
-        chads=None
-    chads2 = chads
-    chads3 = chads
-    if chads==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif chads>=4:
-        style={'textAlign': 'center', 'color':'crimson'}
-    else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return chads, style, chads2, style2, chads3
-
+#### Risk scores in the order they are displayed on the cards and tabs, and their axis labels
+score_names = ['afri', 'chads', 'poaf', 'npoaf', 'simplified', 'comaf']
+score_labels = {'afri': 'AFRI Score', 'chads': 'CHA2DS2-VASc Score', 'poaf': 'POAF Score', 'npoaf': 'NPOAF Score',
+                'simplified': 'Simplified POAF Score', 'comaf': 'COM-AF Score'}
 
-#### Establish a callback for POAF Calculation
+#### Establish a function for the input dataset
+default_data = read_table('../../Data/risk', RISK_SCHEMA)
+
+#### Establish a callback that stores an upload on the server and keeps only its token in the browser
+# --> the other callbacks take the token, so their requests stay small whatever the size of the uploaded file
+# --> the upload's statistics are calculated before the token is stored, so the callbacks it triggers look them up
+# --> a file that is not a supported type or cannot be read leaves the current reference dataset in place, with the
+#     reason shown under the upload
+# --> an upload that could not be saved to upload_cache_dir is only kept in memory; the user is told it will have to
+#     be uploaded again after the dashboard restarts
 @app.callback(
     [
-        dash.dependencies.Output('poaf-card', 'children'),
-        dash.dependencies.Output('poaf-card', 'style'),
-        dash.dependencies.Output('poaf-mini', 'children'),
-        dash.dependencies.Output('poaf-mini', 'style'),
-        dash.dependencies.Output('poaf-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
+        dash.dependencies.Output('input-dataset', 'data'),
+        dash.dependencies.Output('upload-status', 'children')
     ],
+    [dash.dependencies.Input('upload-data', 'contents')],
+    [dash.dependencies.State('upload-data', 'filename')]
 )
-def poaf_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
+def upload_token(contents, filename):
+    if contents is None:
+        return None, None
+    try:
+        token = store_upload(contents, filename, upload_cache_dir, upload_max_bytes, upload_cache_max_bytes,
+                             reference_cache_dir, reference_cache_max_bytes)
+    except ValueError as e:
+        # --> keep the current reference dataset and tell the user why the file was not used
+        return dash.no_update, str(e)
+    if token is None:
+        # --> keep the current reference dataset when the file is not a type that can be read
+        return dash.no_update, filename + " is not a supported file type: upload a .csv, .txt, or .xlsx file"
+    if upload_cache_dir is not None and not upload_on_disk(token, upload_cache_dir):
+        return token, ("This dataset could not be saved on the server and is kept in memory only: "
+                       "upload it again if the dashboard restarts")
+    return token, None
+
+#### Establish a function for the reference dataset of the callbacks: the default one, or the stored upload
+#### shared by every callback (see AF_reference.py); returns the dataset's token and the dataframe
+def reference_data(token):
+    if token is None:
+        return None, default_data
+    df = upload_data(token, upload_cache_dir, upload_max_bytes)
+    if df is None:
+        # --> the upload is no longer stored; leave the outputs as they are
+        raise dash.exceptions.PreventUpdate
+    return token, df
+
+#### Establish a callback that calculates all six risk scores in one round-trip (see AF_scores.py)
+score_outputs = [
+    output
+    for score in score_names
+    for output in (
+        dash.dependencies.Output(score + '-card', 'children'),
+        dash.dependencies.Output(score + '-card', 'style'),
+        dash.dependencies.Output(score + '-mini', 'children'),
+        dash.dependencies.Output(score + '-mini', 'style')
+    )
+] + [
+    dash.dependencies.Output('scores-state', 'data')
+]
+score_inputs = [
+    dash.dependencies.Input('submit-button', 'n_clicks')
+]
+score_states = [
+    dash.dependencies.State('age-state', 'value'),
+    dash.dependencies.State('gender-state', 'value'),
+    dash.dependencies.State('weight-state', 'value'),
+    dash.dependencies.State('height-state', 'value'),
+    dash.dependencies.State('ef-state', 'value'),
+    dash.dependencies.State('eGFR-state', 'value'),
+    dash.dependencies.State('emergency-state', 'value'),
+    dash.dependencies.State('conditions-state', 'value'),
+    dash.dependencies.State('procedures-state', 'value')
+]
+
+def score_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
     ctx = dash.callback_context
     changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
     if ('submit-button' in changed_id):
-        poaf=0
-        if (60 <= age_state <= 69):
-            poaf=poaf+1
-        if (760 <= age_state <= 79): 
-            poaf=poaf+2
-        if (age_state >= 80):
-            poaf=poaf+3
-        if ('copd' in conditions_state):
-            poaf=poaf+1
-        if (eGFR_state < 15):
-            poaf=poaf+1
-        elif ('dialysis' in procedures_state):
-            poaf=poaf+1
-        if (emergency_state == 1):
-            poaf=poaf+1
-        if ('iabp' in procedures_state):
-            poaf=poaf+1
-        if ('cvas' in procedures_state):
-            poaf=poaf+1
-    else: 
-        poaf=None
-    poaf2 = poaf
-    poaf3 = poaf
-    if poaf==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif poaf>=3:
-        style={'textAlign': 'center', 'color':'crimson'}
+        scores = patient_scores(age_state, gender_state, weight_state, height_state, eGFR_state,
+                                emergency_state, conditions_state, procedures_state)
     else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return poaf, style, poaf2, style2, poaf3
-
-
-#### Establish a callback for NPOAF Calculation
+        scores = None
+    outputs = []
+    for score in score_names:
+        val = None if scores is None else scores[score]
+        if val is not None and val >= CUT_POINTS[score]:
+            style={'textAlign': 'center', 'color':'crimson'}
+        else:
+            style={'textAlign': 'center', 'color':'slateblue'}
+        outputs += [val, style, val, style]
+    return outputs + [scores]
+
+
+#### Establish a function for the statistics of the reference dataset (the default one or an upload)
+# --> calculated once per dataset and then read from the cache (see AF_reference.py); those of the default dataset
+#     are calculated when the first page asks for them rather than when the dashboard starts
+def reference_stats_for(token):
+    if token is None:
+        return default_reference_stats()
+    key, df = reference_data(token)
+    return cached_reference_stats(df, reference_cache_dir, reference_cache_max_bytes, data_key=key)
+
+#### Establish a function for the statistics of the default reference dataset, looked up once on first use
+@functools.lru_cache(maxsize=1)
+def default_reference_stats():
+    return cached_reference_stats(default_data, reference_cache_dir, reference_cache_max_bytes)
+
+#### Establish a function for the statistics of one score of the reference dataset
+#### --> None when the dataset has no such score or its statistics could not be calculated
+def score_stats_for(token, score):
+    return reference_stats_for(token)['scores'].get(score)
+
+#### Establish a function for the card text shown in place of a score's statistics that could not be calculated
+def stats_unavailable(token, score):
+    reason = reference_stats_for(token).get('errors', {}).get(score, 'the reference dataset has no ' + score + ' column')
+    return dbc.CardBody(style={'padding-top': '0px'}, children=[
+        html.P(["Validation statistics are not available for this score: ", reason])])
+
+#### Establish a callback for summarizing the reference dataset into a percentile lookup (runs on page load and upload)
+# --> also carries the cut points and score maxima of AF_scores.py, so the clientside scoring reads them from here
+#     rather than keeping its own copy
 @app.callback(
+    dash.dependencies.Output('reference-lookup', 'data'),
     [
-        dash.dependencies.Output('npoaf-card', 'children'),
-        dash.dependencies.Output('npoaf-card', 'style'),
-        dash.dependencies.Output('npoaf-mini', 'children'),
-        dash.dependencies.Output('npoaf-mini', 'style'),
-        dash.dependencies.Output('npoaf-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
-    ],
+        dash.dependencies.Input('input-dataset', 'data')
+    ]
 )
-def npoaf_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
-    ctx = dash.callback_context
-    changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if ('submit-button' in changed_id):
-        npoaf=0
-        if (65 <= age_state <= 74):
-            npoaf=npoaf+2
-        if (age_state >= 75):
-            npoaf=npoaf+3
-        if ('mmvd' in conditions_state):
-            npoaf=npoaf+1
-        if ('smvd' in conditions_state):
-            npoaf=npoaf+3
-        if ('lad' in conditions_state):
-            npoaf=npoaf+1
-    else: 
-        npoaf=None
-    npoaf2 = npoaf
-    npoaf3 = npoaf
-    if npoaf==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif npoaf>=2:
-        style={'textAlign': 'center', 'color':'crimson'}
-    else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return npoaf, style, npoaf2, style2, npoaf3
+def lookup_calc(token):
+    return dict(reference_stats_for(token)['lookup'], cut_points=CUT_POINTS, score_max=SCORE_MAX)
 
 
-#### Establish a callback for Simplified POAF Calculation
-@app.callback(
-    [
-        dash.dependencies.Output('simplified-card', 'children'),
-        dash.dependencies.Output('simplified-card', 'style'),
-        dash.dependencies.Output('simplified-mini', 'children'),
-        dash.dependencies.Output('simplified-mini', 'style'),
-        dash.dependencies.Output('simplified-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
-    ],
-)
-def simplified_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
-    ctx = dash.callback_context
-    changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if ('submit-button' in changed_id):
-        simplified=0
-        if (age_state >= 65):
-            simplified=simplified+2
-        if ('hbp' in conditions_state):
-            simplified=simplified+2
-        if ('MI' in conditions_state):
-            simplified=simplified+1
-        if ('chf' in conditions_state):
-            simplified=simplified+2
-    else: 
-        simplified=None
-    simplified2 = simplified
-    simplified3 = simplified
-    if simplified==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif simplified>=3:
-        style={'textAlign': 'center', 'color':'crimson'}
-    else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return simplified, style, simplified2, style2, simplified3
+#### Establish a callback for the patient's percentile on each score tab
+percentile_outputs = [dash.dependencies.Output(score + '-percentile', 'children') for score in score_names]
+percentile_inputs = [
+    dash.dependencies.Input('scores-state', 'data'),
+    dash.dependencies.Input('reference-lookup', 'data')
+]
 
+def percentile_calc(scores, lookup):
+    return [["Percentile: ", percentile(lookup, score, None if scores is None else scores[score]), "%"]
+            for score in score_names]
 
-#### Establish a callback for COM-AF Calculation
-@app.callback(
-    [
-        dash.dependencies.Output('comaf-card', 'children'),
-        dash.dependencies.Output('comaf-card', 'style'),
-        dash.dependencies.Output('comaf-mini', 'children'),
-        dash.dependencies.Output('comaf-mini', 'style'),
-        dash.dependencies.Output('comaf-state', 'data')
-    ],
-    [
-        dash.dependencies.Input('submit-button', 'n_clicks')
-    ],
-    [
-        dash.dependencies.State('age-state', 'value'),
-        dash.dependencies.State('gender-state', 'value'),
-        dash.dependencies.State('weight-state', 'value'),
-        dash.dependencies.State('height-state', 'value'),
-        dash.dependencies.State('ef-state', 'value'),
-        dash.dependencies.State('eGFR-state', 'value'),
-        dash.dependencies.State('emergency-state', 'value'),
-        dash.dependencies.State('conditions-state', 'value'),
-        dash.dependencies.State('procedures-state', 'value')
-    ],
-)
-def comaf_calc(button_click, age_state, gender_state, weight_state, height_state, ef_state, eGFR_state, emergency_state, conditions_state, procedures_state):
-    ctx = dash.callback_context
-    changed_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    if ('submit-button' in changed_id):
-        comaf=0
-        if (65 <= age_state <= 74):
-            comaf=comaf+1
-        if (age_state >= 75):
-            comaf=comaf+2
-        if (gender_state == 'F'):
-            comaf=comaf+1
-        if ('hbp' in conditions_state):
-            comaf=comaf+1
-        if ('dm' in conditions_state):
-            comaf=comaf+1
-        if ('stroke' in conditions_state):
-            comaf=comaf+2
-    else: 
-        comaf=None
-    comaf2 = comaf
-    comaf3 = comaf
-    if comaf==None:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    elif comaf>=3:
-        style={'textAlign': 'center', 'color':'crimson'}
-    else:
-        style={'textAlign': 'center', 'color':'slateblue'}
-    style2 = style
-    return comaf, style, comaf2, style2, comaf3
 
-#### Establish a callback for the comparison graph
-@app.callback(
-    dash.dependencies.Output('stripchart', 'figure'),
-    [
-        dash.dependencies.Input('upload-data', 'contents'),
-        dash.dependencies.Input('upload-data', 'filename'),
-        dash.dependencies.Input('afri-state', 'data'),
-        dash.dependencies.Input('chads-state', 'data'),
-        dash.dependencies.Input('poaf-state', 'data'),
-        dash.dependencies.Input('npoaf-state', 'data'),
-        dash.dependencies.Input('simplified-state', 'data'),
-        dash.dependencies.Input('comaf-state', 'data'),
-        dash.dependencies.Input('crossfilter-xaxis-column', 'value'),
-        dash.dependencies.Input('crossfilter-yaxis-column', 'value')
-    ]
+#### Register the scoring callbacks on the server or in the browser
+if clientside_scoring:
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction(namespace='af_scores', function_name='calc_scores'),
+        score_outputs, score_inputs, score_states + [dash.dependencies.State('reference-lookup', 'data')]
     )
-def compare_graph(contents, filename, afri_val, chads_val, poaf_val, npoaf_val, simplified_val, comaf_val, xaxis, yaxis):
-    #### Create a graph to compare risk scores two at a time 
-    if contents is not None:
-        df = parse_contents(contents, filename)
-    else:
-        df = default_data
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction(namespace='af_scores', function_name='percentiles'),
+        percentile_outputs, percentile_inputs
+    )
+else:
+    app.callback(score_outputs, score_inputs, score_states)(score_calc)
+    app.callback(percentile_outputs, percentile_inputs)(percentile_calc)
+
+#### Establish a function to draw every patient of the reference dataset on the comparison graph
+def strip_points(df, xaxis, yaxis):
     fig = px.strip(x=df[xaxis], y=df[yaxis], color=df['AF'], 
                     color_discrete_map = {0:'midnightblue',1:'lightsteelblue'},
                     labels={'AF':'Atrial Fibrillation', 'npoaf':'NPOAF Score', 'afri': 'AFRI Score'})
     newnames={'0': 'no', '1': 'yes'}
     fig.for_each_trace(lambda t: t.update(name = newnames[t.name]))
+    return fig
+
+#### Establish a function to draw a large reference dataset on the comparison graph from the patient counts at each
+#### pair of scores (see AF_reference.py): one bubble per pair and AF outcome, sized by its number of patients, with
+#### the two outcomes side by side as in the strip chart
+def bubble_points(df, xaxis, yaxis):
+    counts = pair_counts(df, xaxis, yaxis)
+    fig = go.Figure()
+    for outcome, name, color, offset in [(0, 'no', 'midnightblue', -0.15), (1, 'yes', 'lightsteelblue', 0.15)]:
+        group = counts[counts['AF']==outcome]
+        fig.add_trace(go.Scatter(
+            x=group['x'] + offset, y=group['y'], mode='markers', name=name,
+            marker=dict(color=color, size=group['n'], sizemode='area', sizemin=3,
+                        sizeref=2*max(counts['n'].max(), 1)/40**2),
+            customdata=group[['x', 'n']],
+            hovertemplate='x=%{customdata[0]}<br>y=%{y}<br>patients=%{customdata[1]}<extra></extra>'))
+    fig.update_layout(legend_title_text='Atrial Fibrillation')
+    return fig
+
+#### Establish a function to build the comparison graph for the reference dataset
+#### --> datasets with more than strip_max_rows rows are drawn as bubbles of patient counts instead of points
+def strip_figure(df, xaxis, yaxis):
+    if len(df) > strip_max_rows:
+        fig = bubble_points(df, xaxis, yaxis)
+    else:
+        fig = strip_points(df, xaxis, yaxis)
     fig.update_layout(title_text='Comparison of Two Scores', title_x=0.5)
     fig.update_layout({'plot_bgcolor': 'rgba(0, 0, 0, 0)','paper_bgcolor': 'rgba(0, 0, 0, 0)'})
     fig.update_layout(
@@ -1101,184 +978,198 @@ def compare_graph(contents, filename, afri_val, chads_val, poaf_val, npoaf_val,
             showgrid=False, # Removes Y-axis grid lines
             fixedrange=True      
         ))
-    if afri_val is not None:
-        if xaxis=='afri':
-            xval=afri_val
-        elif xaxis=='chads':
-            xval=chads_val
-        elif xaxis=='poaf':
-            xval=poaf_val
-        elif xaxis=='npoaf':
-            xval=npoaf_val
-        elif xaxis=='simplified':
-            xval=simplified_val
-        elif yaxis=='comaf':
-            xval=comaf_val
-        if yaxis=='afri':
-            yval=afri_val
-        elif yaxis=='chads':
-            yval=chads_val
-        elif yaxis=='poaf':
-            yval=poaf_val
-        elif yaxis=='npoaf':
-            yval=npoaf_val
-        elif yaxis=='simplified':
-            yval=simplified_val
-        elif yaxis=='comaf':
-            yval=comaf_val
-        figa = fig
-        figa.add_trace(
-            go.Scatter(
-                x=[xval],
-                y=[yval],
+    return fig
+
+#### Comparison graphs built so far, by reference dataset token and axes, newest last
+strip_cache = OrderedDict()
+strip_cache_lock = threading.Lock()
+
+#### Establish a function to get the comparison graph of a reference dataset and pair of axes, building it only once
+#### --> returned as a plain figure dictionary shared by every callback, so copy it before changing it
+def cached_strip_figure(token, xaxis, yaxis):
+    cache_key = (token, xaxis, yaxis)
+    with strip_cache_lock:
+        if cache_key in strip_cache:
+            strip_cache.move_to_end(cache_key)
+            return strip_cache[cache_key]
+    key, df = reference_data(token)
+    fig = strip_figure(df, xaxis, yaxis).to_plotly_json()
+    with strip_cache_lock:
+        strip_cache[cache_key] = fig
+        while len(strip_cache) > strip_cache_entries:
+            strip_cache.popitem(last=False)
+    return fig
+
+#### Establish a function for the trace of the patient's scores on the comparison graph (empty before Calculate)
+def patient_marker(scores, xaxis, yaxis):
+    return dict(type='scatter',
+                x=[] if scores is None else [scores[xaxis]],
+                y=[] if scores is None else [scores[yaxis]],
                 mode="markers",
                 marker=dict(color="crimson"),
                 showlegend=False)
-        )
-        return figa
-    else:
+
+#### Establish a function to overlay the patient's scores on the comparison graph (as its last trace)
+def add_patient_marker(fig, scores, xaxis, yaxis):
+    return dict(fig, data=list(fig['data']) + [patient_marker(scores, xaxis, yaxis)])
+
+#### Establish a function for the comparison graph
+#### --> with scores_only the browser already shows the whole graph for this dataset and these axes, so only the
+####     marker's position is sent (as a partial update) instead of the whole figure
+def comparison_figure(token, scores, xaxis, yaxis, scores_only=False):
+    #### Create a graph to compare risk scores two at a time 
+    base = cached_strip_figure(token, xaxis, yaxis)
+    if scores_only:
+        marker = patient_marker(scores, xaxis, yaxis)
+        fig = dash.Patch()
+        fig['data'][len(base['data'])]['x'] = marker['x']
+        fig['data'][len(base['data'])]['y'] = marker['y']
         return fig
+    return add_patient_marker(base, scores, xaxis, yaxis)
 
+#### Establish a function for the record of what the strip chart was drawn for (see stripchart_drawn)
+def drawn_record(token, xaxis, yaxis):
+    return {'token': token, 'xaxis': xaxis, 'yaxis': yaxis,
+            'traces': len(cached_strip_figure(token, xaxis, yaxis)['data']) + 1}
+
+#### Establish a callback for the comparison graph
+#### --> the marker is only patched when the patient's scores are the only change and the page already shows the
+####     whole graph (base traces and marker) for this dataset and these axes; otherwise, such as when the first
+####     call on page load was skipped for the one triggered by scores-state, the whole figure is sent
+def compare_graph(token, scores, xaxis, yaxis, drawn):
+    record = drawn_record(token, xaxis, yaxis)
+    if list(dash.ctx.triggered_prop_ids.values()) == ['scores-state'] and drawn == record:
+        return comparison_figure(token, scores, xaxis, yaxis, scores_only=True), dash.no_update
+    return comparison_figure(token, scores, xaxis, yaxis), record
+
+#### Establish a callback for the comparison graph without the patient marker (clientside scoring)
+def compare_base(token, xaxis, yaxis):
+    return cached_strip_figure(token, xaxis, yaxis)
+
+if clientside_scoring:
+    app.callback(
+        dash.dependencies.Output('stripchart-base', 'data'),
+        [
+            dash.dependencies.Input('input-dataset', 'data'),
+            dash.dependencies.Input('crossfilter-xaxis-column', 'value'),
+            dash.dependencies.Input('crossfilter-yaxis-column', 'value')
+        ]
+    )(compare_base)
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction(namespace='af_scores', function_name='patient_marker'),
+        dash.dependencies.Output('stripchart', 'figure'),
+        [
+            dash.dependencies.Input('stripchart-base', 'data'),
+            dash.dependencies.Input('scores-state', 'data'),
+            dash.dependencies.Input('crossfilter-xaxis-column', 'value'),
+            dash.dependencies.Input('crossfilter-yaxis-column', 'value')
+        ]
+    )
+else:
+    app.callback(
+        [
+            dash.dependencies.Output('stripchart', 'figure'),
+            dash.dependencies.Output('stripchart-drawn', 'data')
+        ],
+        [
+            dash.dependencies.Input('input-dataset', 'data'),
+            dash.dependencies.Input('scores-state', 'data'),
+            dash.dependencies.Input('crossfilter-xaxis-column', 'value'),
+            dash.dependencies.Input('crossfilter-yaxis-column', 'value')
+        ],
+        [dash.dependencies.State('stripchart-drawn', 'data')]
+    )(compare_graph)
+
+
+#### Establish a callback for calculating validation metrics at the cut point chosen on the tab's slider
+# --> the classification at every cut point is part of the cached reference statistics, so moving a slider is a lookup
+cut_inputs = [dash.dependencies.Input(score + '-cut', 'value') for score in score_names]
 
-#### Establish a callback for calculating validation metrics
 @app.callback(
+    [dash.dependencies.Output(score + '-val', 'children') for score in score_names],
     [
-        dash.dependencies.Output('afri-val', 'children'),
-        dash.dependencies.Output('chads-val', 'children'),
-        dash.dependencies.Output('poaf-val', 'children'),
-        dash.dependencies.Output('npoaf-val', 'children'),
-        dash.dependencies.Output('simplified-val', 'children'),
-        dash.dependencies.Output('comaf-val', 'children')
-    ],
-    [
-        dash.dependencies.Input('upload-data', 'contents'),
-        dash.dependencies.Input('upload-data', 'filename'),
-        dash.dependencies.Input('afri-state', 'data'),
-        dash.dependencies.Input('chads-state', 'data'),
-        dash.dependencies.Input('poaf-state', 'data'),
-        dash.dependencies.Input('npoaf-state', 'data'),
-        dash.dependencies.Input('simplified-state', 'data'),
-        dash.dependencies.Input('comaf-state', 'data'),
+        dash.dependencies.Input('input-dataset', 'data'),
         dash.dependencies.Input('score-tab', 'active_tab')
-    ]
+    ] + cut_inputs
 )
-def score_val(contents, filename, afri_val, chads_val, poaf_val, npoaf_val, simplified_val, comaf_val, score_tab):
-    if contents is not None:
-        df = parse_contents(contents, filename)
-    else:
-        df = default_data
-    if score_tab == "afri-tab":
-        df['score'] = df['afri']
-        val = afri_val
-        cut = 2
-    elif score_tab == "chads-tab":
-        df['score'] = df['chads']
-        val = chads_val
-        cut = 4
-    elif score_tab == 'poaf-tab':
-        df['score'] = df['poaf']
-        val = poaf_val
-        cut = 3
-    elif score_tab == 'npoaf-tab':
-        df['score'] = df['npoaf']
-        val = npoaf_val
-        cut = 2
-    elif score_tab == 'simplified-tab':
-        df['score'] = df['simplified']
-        val = simplified_val
-        cut = 3
-    elif score_tab == 'comaf-tab':
-        df['score'] = df['comaf']
-        val = comaf_val
-        cut = 3
-    ### --> calculate percentile
-    if val is not None:
-        n_total = len(df)
-        n_less = len(df[df['score']<val])
-        percentile = round((n_less/n_total)*100)
+def score_val(token, score_tab, *cuts):
+    ### --> read the tabulated totals for TP, FP, FN, and TN at the cut point and the odds ratio of the tab's score
+    score = score_tab.replace('-tab', '')
+    stats = score_stats_for(token, score)
+    if stats is None:
+        return [stats_unavailable(token, score) for _ in score_names]
+    cut = cuts[score_names.index(score)]
+    cut = stats['cut'] if cut is None else cut
+    counts = cut_metrics(stats['roc'], cut)
+    TP, FP, FN, TN = (counts[k] for k in ['TP', 'FP', 'FN', 'TN'])
+    ### --> format the results for the card (a share with nobody to count is shown as -)
+    if math.isnan(stats['odds_ratio']):
+        odds = html.P("Odds Ratio: not estimable for this reference dataset")
     else:
-        percentile=None
-    ### --> classify predicted AF outcome based on cut point
-    df['AF_cut'] = np.where((df['score']>=cut),1,0)
-    ### --> tabulate totals for TP, FP, FN, and TN
-    TP = len(df[(df['AF']==1) & (df['AF_cut']==1)])
-    FP = len(df[(df['AF']==0) & (df['AF_cut']==1)])
-    FN = len(df[(df['AF']==1) & (df['AF_cut']==0)])
-    TN = len(df[(df['AF']==0) & (df['AF_cut']==0)])
-    ### --> define the independent and response variables
-    independent1 = df['score']
-    response1 = df['AF']
-    ### --> bulid the logistic regression model
-    log1 = sm.Logit(response1,sm.add_constant(independent1)).fit() #use 'add_constant' to add the intercept to the model
-    ### --> format the CI for the estimate
-    ci1 = np.exp(log1.conf_int(alpha=0.05)).drop(index="const", axis=0)
-    ci1.columns = ["2.5%", "97.5%"]
-    or1 = np.exp(log1.params['score'].item())
-    ci1_lower = ci1['2.5%'].item()
-    ci1_higher = ci1['97.5%'].item()
-    ### --> format the results for the card
-    OR = round(or1, 2)
-    lower = round(ci1_lower,2)
-    higher = round(ci1_higher,2)
-    sensitivity = round((TP/(TP+FN))*100)
-    specificity = round((TN/(TN+FP))*100)
-    PPV = round((TP/(TP+FP))*100)
-    NPV = round((TN/(TN+FN))*100)
-    afri_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
-                    html.P(["Sensitivity: ", sensitivity, "%"]),
-                    html.P(["Specificity: ", specificity, "%"]),
-                    html.P(["Positive Predictive Value: ", PPV, "%"]),
-                    html.P(["Negative Predictive Value: ", NPV, "%"])
-                ])
-    chads_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
-                    html.P(["Sensitivity: ", sensitivity, "%"]),
-                    html.P(["Specificity: ", specificity, "%"]),
-                    html.P(["Positive Predictive Value: ", PPV, "%"]),
-                    html.P(["Negative Predictive Value: ", NPV, "%"])
-                ])
-    poaf_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
-                    html.P(["Sensitivity: ", sensitivity, "%"]),
-                    html.P(["Specificity: ", specificity, "%"]),
-                    html.P(["Positive Predictive Value: ", PPV, "%"]),
-                    html.P(["Negative Predictive Value: ", NPV, "%"])
-                ])
-    npoaf_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
-                    html.P(["Sensitivity: ", sensitivity, "%"]),
-                    html.P(["Specificity: ", specificity, "%"]),
-                    html.P(["Positive Predictive Value: ", PPV, "%"]),
-                    html.P(["Negative Predictive Value: ", NPV, "%"])
-                ])
-    simplified_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
-                    html.P(["Sensitivity: ", sensitivity, "%"]),
-                    html.P(["Specificity: ", specificity, "%"]),
-                    html.P(["Positive Predictive Value: ", PPV, "%"]),
-                    html.P(["Negative Predictive Value: ", NPV, "%"])
-                ])
-    comaf_val = dbc.CardBody([
-                    html.P(["Percentile: ", percentile, "%"]),
-                    html.P(["Odds Ratio: ", OR, " (95% CI: ", lower, "-", higher, ")"]),
-                    html.P(["Cut Point: ", cut]),
+        odds = html.P(["Odds Ratio: ", round(stats['odds_ratio'], 2),
+                       " (95% CI: ", round(stats['ci'][0],2), "-", round(stats['ci'][1],2), ")"])
+    share = lambda part, total: round((part/total)*100) if total else '-'
+    sensitivity = share(TP, TP+FN)
+    specificity = share(TN, TN+FP)
+    PPV = share(TP, TP+FP)
+    NPV = share(TN, TN+FN)
+    val = dbc.CardBody(style={'padding-top': '0px'}, children=[
+                    odds,
+                    html.P(["AUC: ", round(stats['roc']['auc'], 3)]),
+                    html.P(["Cut Point: ", cut, " (highest Youden index at ", stats['roc']['youden_cut'], ")"]),
                     html.P(["Sensitivity: ", sensitivity, "%"]),
                     html.P(["Specificity: ", specificity, "%"]),
                     html.P(["Positive Predictive Value: ", PPV, "%"]),
                     html.P(["Negative Predictive Value: ", NPV, "%"])
                 ])
-    return afri_val, chads_val, poaf_val, npoaf_val, simplified_val, comaf_val
+    return [val for _ in score_names]
+
+#### Establish a callback for the ROC curve of the tab's score with its slider's cut point marked
+@app.callback(
+    [dash.dependencies.Output(score + '-roc', 'children') for score in score_names],
+    [
+        dash.dependencies.Input('input-dataset', 'data'),
+        dash.dependencies.Input('score-tab', 'active_tab')
+    ] + cut_inputs
+)
+def roc_val(token, score_tab, *cuts):
+    score = score_tab.replace('-tab', '')
+    stats = score_stats_for(token, score)
+    if stats is None:
+        return [html.Div() for _ in score_names]
+    roc = stats['roc']
+    cut = cuts[score_names.index(score)]
+    ### --> one point per threshold, from nobody classified as AF to everybody
+    fpr = [fp / max(roc['negatives'], 1) for fp in reversed(roc['fp'])]
+    tpr = [tp / max(roc['positives'], 1) for tp in reversed(roc['tp'])]
+    fig2 = go.Figure()
+    fig2.add_trace(go.Scatter(x=[0, 1], y=[0, 1], mode='lines', line=dict(color='#BCCCDC', dash='dash'),
+                              hoverinfo='skip', showlegend=False))
+    fig2.add_trace(go.Scatter(x=fpr, y=tpr, mode='lines+markers', line=dict(color='midnightblue'), showlegend=False,
+                              text=['above ' + str(roc['levels'][-1])] + [str(level) for level in reversed(roc['levels'])],
+                              hovertemplate='Cut Point %{text}<br>1 - Specificity %{x:.2f}<br>Sensitivity %{y:.2f}<extra></extra>'))
+    if cut is not None:
+        counts = cut_metrics(roc, cut)
+        fig2.add_trace(go.Scatter(x=[counts['FP'] / max(roc['negatives'], 1)], y=[counts['TP'] / max(roc['positives'], 1)],
+                                  mode='markers', marker=dict(color='crimson', size=10), showlegend=False,
+                                  hovertemplate='Cut Point ' + str(cut) + '<extra></extra>'))
+    fig2.update_layout(title_text=f"ROC Curve (AUC {roc['auc']:.3f})", title_x=0.5)
+    fig2.update_layout({'plot_bgcolor': 'rgba(0, 0, 0, 0)','paper_bgcolor': 'rgba(0, 0, 0, 0)'})
+    fig2.update_layout(xaxis=dict(
+            title="1 - Specificity",
+            range=[0, 1],
+            linecolor="#BCCCDC",  # Sets color of X-axis line
+            showgrid=False, # Removes X-axis grid lines
+            fixedrange=True
+        ),
+        yaxis=dict(
+            title="Sensitivity",
+            range=[0, 1],
+            linecolor="#BCCCDC",  # Sets color of Y-axis line
+            showgrid=False, # Removes Y-axis grid lines
+            fixedrange=True
+        ))
+    return [dcc.Graph(figure=fig2) for _ in score_names]
 
 #### Establish a callback for producing score histograms
 @app.callback(
@@ -1291,61 +1182,26 @@ def score_val(contents, filename, afri_val, chads_val, poaf_val, npoaf_val, simp
         dash.dependencies.Output('comaf-hist', 'children')
     ],
     [
-        dash.dependencies.Input('upload-data', 'contents'),
-        dash.dependencies.Input('upload-data', 'filename'),
+        dash.dependencies.Input('input-dataset', 'data'),
         dash.dependencies.Input('score-tab', 'active_tab')
     ]
 )
-def afri_val(contents, filename, score_tab):
-    if contents is not None:
-        df = parse_contents(contents, filename)
-    else:
-        df = default_data
-    if score_tab == "afri-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="afri", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'afri':'AFRI Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='AFRI Scores by Atrial Fibrillation Outcome', title_x=0.5)
-    elif score_tab == "chads-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="chads", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'chads':'CHA2DS2-VASc Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='CHA2DS2-VASc Scores by Atrial Fibrillation Outcome', title_x=0.5)
-    elif score_tab == "poaf-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="poaf", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'poaf':'POAF Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='POAF Scores by Atrial Fibrillation Outcome', title_x=0.5)
-    elif score_tab == "npoaf-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="npoaf", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'npoaf':'NPOAF Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='NPOAF Scores by Atrial Fibrillation Outcome', title_x=0.5)
-    elif score_tab == "simplified-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="simplified", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'simplified':'Simplified POAF Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='Simplified POAF Scores by Atrial Fibrillation Outcome', title_x=0.5)
-    elif score_tab == "comaf-tab":
-        ### --> establish histogram
-        fig1 = px.histogram(df, x="comaf", histnorm="probability", color="AF", 
-                           color_discrete_map = {0:'midnightblue',1:'lightsteelblue'}, barmode='overlay', 
-                           labels={'AF':'Atrial Fibrillation', 'comaf':'COM-AF Score'})
-        ### --> change figure title
-        fig1.update_layout(title_text='COM-AF Scores by Atrial Fibrillation Outcome', title_x=0.5)
+def afri_val(token, score_tab):
+    ### --> establish histogram from the share of each outcome's patients at each score level
+    score = score_tab.replace('-tab', '')
+    stats = score_stats_for(token, score)
+    if stats is None:
+        return [html.Div() for _ in score_names]
+    histogram = stats['histogram']
+    fig1 = go.Figure()
+    for outcome, color in [('no', 'midnightblue'), ('yes', 'lightsteelblue')]:
+        fig1.add_trace(go.Bar(x=histogram['levels'], y=histogram[outcome], name=outcome,
+                              marker=dict(color=color, opacity=0.5)))
+    fig1.update_layout(barmode='overlay', bargap=0, legend_title_text='Atrial Fibrillation',
+                       xaxis_title=score_labels[score])
+    ### --> change figure title
+    fig1.update_layout(title_text=score_labels[score] + 's by Atrial Fibrillation Outcome', title_x=0.5)
     ### --> update formatting of the figure
-    newnames={'0': 'no', '1': 'yes'}
-    fig1.for_each_trace(lambda t: t.update(name = newnames[t.name]))
     fig1.update_layout({'plot_bgcolor': 'rgba(0, 0, 0, 0)','paper_bgcolor': 'rgba(0, 0, 0, 0)'})
     fig1.update_layout(xaxis=dict(
             linecolor="#BCCCDC",  # Sets color of X-axis line
@@ -1380,10 +1236,11 @@ def run_server(self, host,
     serve(self, host=host, port=port)
 
 
-#### Configure the settings to avoid an attribute error when using JupyterDash
-del app.config._read_only["requests_pathname_prefix"]
-
+#### Start the server only when run as a script, so the callbacks can be imported (see AF_benchmark.py)
+if __name__ == '__main__':
+    #### Configure the settings to avoid an attribute error when using JupyterDash
+    del app.config._read_only["requests_pathname_prefix"]
 
-#### Run the app (modify port as necessary to find one that is not in use; macOS users should change host to host='')
-app.run_server(host='', port=8050)
+    #### Run the app (modify port as necessary to find one that is not in use; macOS users should change host to host='')
+    app.run(host='', port=8050)
 
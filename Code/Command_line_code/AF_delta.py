@@ -0,0 +1,76 @@
+## Incremental Processing of New and Changed Admissions
+
+### Import Necessary Packages
+import os
+import pandas as pd
+
+
+### Establish a function to choose the admissions an incremental run has to process
+# --> admissions in the CABG cohort that are missing from the previous run's output, plus those listed in the
+#     changed file (a csv with a HADM_ID column), widened to every CABG admission of the same subjects because
+#     their subject-median fills depend on each other
+# --> returns the SUBJECT_ID and HADM_ID of the admissions to process
+def delta_admissions(cabg, previous, changed_path=None):
+    ids = cabg[['SUBJECT_ID', 'HADM_ID']].drop_duplicates()
+    done = pd.MultiIndex.from_frame(previous[['subject_id', 'hadm_id']].astype('int32'))
+    new = ~pd.MultiIndex.from_frame(ids.astype('int32')).isin(done)
+    if changed_path is not None:
+        changed = pd.read_csv(changed_path, usecols=['HADM_ID'])['HADM_ID']
+        new = new | ids['HADM_ID'].isin(changed).to_numpy()
+    subjects = ids.loc[new, 'SUBJECT_ID']
+    return ids.loc[ids['SUBJECT_ID'].isin(subjects)].reset_index(drop=True)
+
+
+### Establish a function to count the observed values of each item by age group and gender
+# --> the counts of several batches of admissions add up, so medians can be updated without the earlier batches
+def median_counts(vitals, items=('height', 'weight')):
+    long = vitals.melt(id_vars=['age_group', 'GENDER'], value_vars=list(items), var_name='item').dropna()
+    return long.groupby(['age_group', 'GENDER', 'item', 'value'], as_index=False).size().rename(
+        columns={'size': 'count'})
+
+
+### Establish a function to add and remove batches of value counts
+def merge_counts(counts, add=None, remove=None):
+    parts = [counts]
+    if add is not None:
+        parts.append(add)
+    if remove is not None:
+        parts.append(remove.assign(count=-remove['count']))
+    merged = pd.concat(parts).groupby(['age_group', 'GENDER', 'item', 'value'], as_index=False)['count'].sum()
+    return merged.loc[merged['count'] > 0].reset_index(drop=True)
+
+
+### Establish a function to take the median of each item by age group and gender from value counts
+# --> same as the median of the values themselves (the mean of the two middle values for an even count)
+def group_medians(counts):
+    counts = counts.sort_values(['age_group', 'GENDER', 'item', 'value'])
+    keys = ['age_group', 'GENDER', 'item']
+    total = counts.groupby(keys)['count'].transform('sum')
+    above = counts.groupby(keys)['count'].cumsum()
+    below = above - counts['count']
+    # --> the values holding the lower and upper middle positions (0-based (n-1)//2 and n//2)
+    lower = counts.loc[(below <= (total - 1) // 2) & ((total - 1) // 2 < above)].set_index(keys)['value']
+    upper = counts.loc[(below <= total // 2) & (total // 2 < above)].set_index(keys)['value']
+    medians = ((lower + upper) / 2).rename('value').reset_index()
+    return medians.pivot_table(index=['age_group', 'GENDER'], columns='item', values='value').reset_index().rename_axis(
+        columns=None)
+
+
+### Establish a function to replace the rows of the delta admissions in a dataset and add the new ones
+# --> rows are matched on (subject_id, hadm_id) and the result is ordered by them
+def merge_delta(existing, delta, keys=('subject_id', 'hadm_id')):
+    keys = list(keys)
+    replaced = pd.MultiIndex.from_frame(existing[keys]).isin(pd.MultiIndex.from_frame(delta[keys]))
+    merged = pd.concat([existing.loc[~replaced], delta], ignore_index=True)
+    return merged.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+### Establish functions to store and load the state kept between incremental runs
+def save_state(df, path):
+    df.to_parquet(path + '.parquet', index=False)
+
+
+def load_state(path):
+    if not os.path.exists(path + '.parquet'):
+        raise FileNotFoundError(f'{path}.parquet not found; run the pipeline once with incremental = False')
+    return pd.read_parquet(path + '.parquet')
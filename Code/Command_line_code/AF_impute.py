@@ -0,0 +1,106 @@
+## Multiple Imputation by Chained Equations (in-process replacement for AF_impute.R)
+
+### Import Necessary Packages
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from AF_io import wait_for_loaders
+
+
+### Establish a function to draw imputations for one variable by predictive mean matching
+# --> follows the default 'pmm' method of the R mice package: fit a linear model on the observed rows,
+#     draw the coefficients from their posterior, and give each missing row the observed value of one of
+#     the `donors` observed rows whose predictions are closest to its own
+def pmm(y_obs, X_obs, X_mis, rng, donors=5):
+    X_obs = np.column_stack([np.ones(len(X_obs)), X_obs])
+    X_mis = np.column_stack([np.ones(len(X_mis)), X_mis])
+    xtx = X_obs.T @ X_obs
+    xtx += np.eye(len(xtx)) * 1e-5 * max(np.trace(xtx) / len(xtx), 1e-10)
+    xtx_inv = np.linalg.inv(xtx)
+    beta_hat = xtx_inv @ X_obs.T @ y_obs
+    resid = y_obs - X_obs @ beta_hat
+    dof = max(len(y_obs) - X_obs.shape[1], 1)
+    sigma = np.sqrt(resid @ resid / rng.chisquare(dof))
+    beta_draw = beta_hat + sigma * np.linalg.cholesky((xtx_inv + xtx_inv.T) / 2) @ rng.standard_normal(len(beta_hat))
+
+    pred_obs = X_obs @ beta_hat
+    pred_mis = X_mis @ beta_draw
+    donors = min(donors, len(y_obs))
+    # --> the closest donors lie within `donors` places of each missing row's position in the sorted predictions
+    order = np.argsort(pred_obs)
+    sorted_pred = pred_obs[order]
+    pos = np.searchsorted(sorted_pred, pred_mis)
+    window = np.clip(pos[:, None] + np.arange(-donors, donors)[None, :], 0, len(y_obs) - 1)
+    dist = np.abs(sorted_pred[window] - pred_mis[:, None])
+    nearest = np.take_along_axis(window, np.argsort(dist, axis=1, kind='stable')[:, :donors], axis=1)
+    pick = nearest[np.arange(len(pred_mis)), rng.integers(0, donors, len(pred_mis))]
+    return y_obs[order[pick]]
+
+
+### Establish a function to produce one completed dataset by chained equations
+# --> values is a float array (rows x variables) with NaN for missing values
+def _impute_once(values, n_iter, seed, donors):
+    rng = np.random.default_rng(seed)
+    values = values.copy()
+    missing = np.isnan(values)
+    targets = [j for j in range(values.shape[1]) if missing[:, j].any() and not missing[:, j].all()]
+    # --> start from random draws of the observed values (as mice does)
+    for j in targets:
+        observed = values[~missing[:, j], j]
+        values[missing[:, j], j] = rng.choice(observed, missing[:, j].sum())
+    for _ in range(n_iter):
+        for j in targets:
+            others = [k for k in range(values.shape[1]) if k != j and not missing[:, k].all()]
+            obs, mis = ~missing[:, j], missing[:, j]
+            values[mis, j] = pmm(values[obs, j], values[obs][:, others], values[mis][:, others], rng, donors)
+    return values
+
+
+def _impute_task(args):
+    return _impute_once(*args)
+
+
+### Establish a function to run m chained-equation imputations of the given columns, in parallel across processes
+# --> returns m completed copies of df; text columns (such as gender) are imputed through their category codes
+# --> the imputed columns keep their types (such as int16 age or categorical gender); integer columns that still have
+#     missing values afterwards (no observed rows to draw donors from) become float64
+# --> every imputation gets its own random stream derived from seed, so results do not depend on `processes`;
+#     forked workers do not re-run the calling script, so on platforms without fork the imputations run in turn
+def mice(df, columns, m=5, n_iter=5, seed=0, processes=None, donors=5):
+    encoded, categories = {}, {}
+    for col in columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            encoded[col] = df[col].astype('float64')
+        else:
+            codes, categories[col] = pd.factorize(df[col])
+            encoded[col] = pd.Series(np.where(codes < 0, np.nan, codes), index=df.index)
+    values = np.column_stack([encoded[col].to_numpy() for col in columns])
+    seeds = np.random.SeedSequence(seed).spawn(m)
+    tasks = [(values, n_iter, s, donors) for s in seeds]
+
+    if processes == 1 or m == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        results = [_impute_task(task) for task in tasks]
+    else:
+        # --> no reader threads may be running when the workers are forked (see AF_io.py)
+        wait_for_loaders()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+            results = list(pool.map(_impute_task, tasks))
+
+    imputations = []
+    for result in results:
+        completed = df.copy()
+        for j, col in enumerate(columns):
+            if col in categories:
+                codes = result[:, j]
+                values = pd.Series(np.where(np.isnan(codes), None,
+                                            categories[col].to_numpy()[np.nan_to_num(codes).astype('int64')]),
+                                   index=df.index)
+                completed[col] = values.astype(df[col].dtype)
+            elif pd.api.types.is_float_dtype(df[col]) or not np.isnan(result[:, j]).any():
+                completed[col] = pd.Series(result[:, j], index=df.index).astype(df[col].dtype)
+            else:
+                completed[col] = result[:, j]
+        imputations.append(completed)
+    return imputations
@@ -0,0 +1,157 @@
+## Risk Score Indicators from the MIMIC-III Diagnosis, Procedure, and Admission Tables
+
+### Import Necessary Packages
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+### ICD-9 diagnosis code sets for each indicator (exact codes, prefixes such as "250*", or ranges such as "410-414")
+DIAGNOSIS_CODES = {
+    # --> Congestive Heart Failure/Left Ventricular Dysfunction (CHADS)
+    'chf': ['4280', '4281'],
+    # --> Hypertension (CHADS)
+    'hbp': ['4010', '4011', '4019'],
+    # --> Diabetes Mellitus (CHADS)
+    'dm': ['24900', '24901', '24910', '24911', '24920', '24921', '24930', '24931', '24940', '24941', '24950', '24951', '24960', '24961',
+           '24970', '24971', '24980', '24981', '24990', '24991', '25000', '25001', '25002', '25003', '25010', '25011', '25012', '25013',
+           '25020', '25021', '25022', '25023', '25030', '25031', '25032', '25033', '25040', '25041', '25042', '25043', '25050', '25051',
+           '25052', '25053', '25060', '25061', '25062', '25063', '25070', '25071', '25072', '25073', '25080', '25081', '25082', '25083',
+           '25090', '25091', '25092', '25093', '64800', '64801', '64802', '64803', '64804'],
+    # --> Stroke/Transient Ischemic Attack/Thromboembolism (CHADS)
+    'stroke': ['V1254'],
+    # --> Vascular Disease (CHADS)
+    'vd': ['393', '3940', '3941', '3942', '3949', '3950', '3951', '3952', '3959', '3960', '3961', '3962', '3963', '3968',
+           '3969', '3970', '3971', '3979', '3980', '4010', '4011', '4019', '40200', '40201', '40210', '40211', '40290', '40291',
+           '40300', '40310', '40311', '40390', '40391', '40400', '40401', '40402', '40403', '40410', '40411', '40412', '40413', '40490',
+           '40491', '40492', '40493', '40501', '40509', '40511', '40519', '40591', '40599', '41000', '41001', '41002', '41010', '41011',
+           '41012', '41020', '41021', '41022', '41030', '41031', '41032', '41040', '41041', '41042', '41050', '41051', '41052', '41060',
+           '41061', '41062', '41070', '41071', '41072', '41080', '41081', '41082', '41090', '41091', '41092', '4110', '4111', '41181',
+           '41189', '412', '4130', '4131', '4139', '41400', '41401', '41402', '41403', '41404', '41405', '41406', '41407', '41410',
+           '41411', '41412', '41419', '4142', '4143', '4144', '4148', '4149', '4150', '41511', '41512', '41513', '41519', '4160',
+           '4161', '4162', '4168', '4169', '4170', '4171', '4178', '4179', '4200', '42090', '42091', '42099', '4210', '4211',
+           '4219', '4220', '42290', '42291', '42292', '42293', '42299', '4230', '4231', '4232', '4233', '4238', '4239', '4240',
+           '4241', '4242', '4243', '42490', '42491', '42499', '4250', '42511', '42518', '4252', '4253', '4254', '4255', '4257',
+           '4258', '4259', '4260', '42610', '42611', '42612', '42613', '4262', '4263', '4264', '42650', '42651', '42652', '42653',
+           '42654', '4266', '4267', '42681', '42682', '42689', '4269', '4270', '4271', '4272', '42731', '42732', '42741', '42742',
+           '4275', '42760', '42761', '42769', '42781', '42789', '4279', '4280', '4281', '42820', '42821', '42822', '42823', '42830',
+           '42831', '42832', '42840', '42841', '42842', '42843', '4289', '4290', '4291', '4292', '4293', '4294', '4295', '4296',
+           '42971', '42979', '42981', '42982', '42983', '42989', '4299', '430', '431', '4320', '4321', '4329', '43300',
+           '43301', '43310', '43320', '43321', '43330', '43331', '43380', '43381', '43390', '43391', '43400', '43401', '43410', '43411',
+           '43490', '43491', '4350', '4351', '4352', '4353', '4358', '436', '4370', '4371', '4372', '4373', '4374', '4375',
+           '4376', '4377', '4378', '4379', '4380', '43810', '43811', '43812', '43813', '43814', '43819', '43820', '43821', '43822',
+           '43830', '43831', '43840', '43841', '43842', '43850', '43851', '43852', '43853', '4386', '4387', '43881', '43882', '43883',
+           '4400', '4401', '44020', '44021', '44022', '44023', '44024', '44029', '44030', '44031', '44032', '4404', '4408', '4409',
+           '44100', '44101', '44102', '44103', '4411', '4412', '4413', '4414', '4415', '4416', '4417', '4419', '4420', '4421',
+           '4422', '4423', '44281', '44282', '44283', '44284', '44289', '4429', '4430', '4431', '44321', '44322', '44323', '44324',
+           '44329', '44381', '44389', '4439', '44401', '44409', '4441', '44421', '44481', '44489', '4449', '44501', '44502',
+           '44581', '44589', '4460', '4461', '44620', '44621', '44629', '4463', '4464', '4465', '4466', '4467', '4470', '4471',
+           '4472', '4473', '4474', '4475', '4476', '44770', '44771', '44772', '44773', '4478', '4479', '4480', '4481', '4489',
+           '449'],
+    # --> Peripheral Vascular Disease (AFRI)
+    'pvd': ['44020', '44021', '44022', '44023', '44024', '44029', '4430', '4431', '44321', '44322', '44323', '44324', '44329', '44381',
+            '44389', '4439', '45981', '74760', '74769', '9972'],
+    # --> Left Atrial Dilation (NPOAF)
+    'lad': ['4293'],
+    # --> Mitral Valve Disease (NPOAF, split into mild and moderate-to-severe using the notes)
+    'mvd': ['3940', '3941', '3942', '3949', '3960', '3961', '3962', '3963', '3968', '3969'],
+    # --> COPD (POAF)
+    'copd': ['49320', '49321', '49322'],
+    # --> myocardial infaction (Simplified)
+    'MI': ['41000', '41001', '41002', '41010', '41011', '41012', '41020', '41021', '41022', '41030', '41031', '41032', '41040', '41041',
+           '41042', '41050', '41051', '41052', '41060', '41061', '41062', '41070', '41071', '41072', '41080', '41081', '41082', '41090',
+           '41091', '41092'],
+    # --> Atrial Fibrillation (outcome for all risk scores)
+    'AF': ['42731'],
+}
+
+### ICD-9 procedure code sets for each indicator (same patterns as DIAGNOSIS_CODES)
+PROCEDURE_CODES = {
+    # --> Intra-aortic Balloon Pump (POAF)
+    'iabp': ['3596'],
+    # --> Combined Valve/Artery Surgery (POAF)
+    'cvas': ['3500', '3501', '3502', '3503', '3504', '3505', '3506', '3507', '3509', '3510', '3511', '3512', '3513', '3514',
+             '3520', '3521', '3522', '3523', '3524', '3525', '3526', '3527', '3528', '3539', '3599'],
+    # --> Dialysis (POAF)
+    'dialysis': ['3895', '3995', '5498'],
+}
+
+
+### Establish a function to read ICD-9 codes as a categorical of strings
+# --> AF_io.py reads the codes as categoricals of strings; codes parsed as numbers elsewhere (PROCEDURES_ICD codes
+#     are all digits) are turned into strings that match the code lists
+# --> only the distinct codes are converted, never the column itself
+def icd_strings(codes):
+    codes = codes if isinstance(codes.dtype, pd.CategoricalDtype) else codes.astype('category')
+    categories = pd.Series(codes.cat.categories)
+    if pd.api.types.is_numeric_dtype(categories):
+        categories = categories.astype('Int64')
+    return codes.cat.rename_categories(categories.astype(str).tolist())
+
+
+### Establish a function to restrict a MIMIC table to the cohort's (SUBJECT_ID, HADM_ID) pairs
+def in_cohort(table, cohort):
+    ids = cohort.rename(columns=str.upper)[['SUBJECT_ID', 'HADM_ID']].drop_duplicates()
+    return pd.merge(table, ids, how='inner', on=['SUBJECT_ID', 'HADM_ID'])
+
+
+### Establish a function to build a sparse admission x code incidence matrix in one pass over a code table
+# --> rows follow the cohort's admissions in order, columns are the distinct ICD-9 codes seen (returned as vocab)
+def incidence_matrix(codes, cohort):
+    ids = cohort.rename(columns=str.upper)[['SUBJECT_ID', 'HADM_ID']].drop_duplicates().reset_index(drop=True)
+    ids['row'] = np.arange(len(ids))
+    codes = pd.merge(codes[['SUBJECT_ID', 'HADM_ID', 'ICD9_CODE']], ids, how='inner', on=['SUBJECT_ID', 'HADM_ID'])
+    icd = icd_strings(codes['ICD9_CODE']).cat
+    # --> rows without a code (code -1) are left out
+    known = (icd.codes >= 0).to_numpy()
+    matrix = sparse.csr_matrix((np.ones(known.sum(), dtype='int32'),
+                                (codes['row'].to_numpy()[known], icd.codes.to_numpy()[known])),
+                               shape=(len(ids), len(icd.categories)))
+    return matrix, pd.Index(icd.categories), ids[['SUBJECT_ID', 'HADM_ID']]
+
+
+### Establish a function to find which codes in a vocabulary belong to a code set
+# --> a code set is a list of patterns: exact codes ('4280'), prefixes ('250*'), or ranges over the leading
+#     characters of a code ('410-414' matches every code from 410 through 414xx)
+def match_codes(vocab, patterns):
+    vocab = pd.Series(vocab, dtype=object)
+    exact = [p for p in patterns if not p.endswith('*') and '-' not in p]
+    hit = vocab.isin(exact).to_numpy()
+    for p in patterns:
+        if p.endswith('*'):
+            hit = hit | vocab.str.startswith(p[:-1]).to_numpy()
+        elif '-' in p:
+            lo, hi = p.split('-')
+            head = vocab.str[:len(lo)]
+            hit = hit | ((vocab.str.len() >= len(lo)) & (head >= lo) & (head <= hi)).to_numpy()
+    return hit
+
+
+### Establish a function to reduce a diagnosis or procedure table to one row of 0/1 (uint8) indicators per admission
+# --> code_sets maps each indicator name to its patterns (DIAGNOSIS_CODES or PROCEDURE_CODES); the patterns are
+#     matched against the distinct codes only and every indicator is one sparse product with the incidence matrix
+def code_indicators(codes, cohort, code_sets):
+    matrix, vocab, ids = incidence_matrix(codes, cohort)
+    members = np.column_stack([match_codes(vocab, patterns) for patterns in code_sets.values()]).astype('int32')
+    counts = matrix @ members
+    flags = pd.DataFrame((counts > 0).astype('uint8'), columns=list(code_sets))
+    return pd.concat([ids, flags], axis=1)
+
+
+### Establish a function to reduce the admissions table to one row of indicators per admission
+def admission_indicators(admissions, cohort):
+    adm = in_cohort(admissions[['SUBJECT_ID', 'HADM_ID', 'ADMISSION_TYPE']], cohort)
+    # --> Emergency (POAF)
+    adm['emergency'] = (adm['ADMISSION_TYPE']=='EMERGENCY').astype('uint8')
+    return adm.groupby(['SUBJECT_ID', 'HADM_ID'], as_index=False)[['emergency']].max()
+
+
+### Establish a function to join per-admission indicator tables onto the cohort (one row per admission throughout)
+# --> admissions missing from an indicator table get 0 for each of its indicators
+def join_indicators(cohort, *tables):
+    joined = cohort
+    for table in tables:
+        cols = [col for col in table.columns if col not in ('SUBJECT_ID', 'HADM_ID')]
+        joined = pd.merge(joined, table, how='left', left_on=['subject_id', 'hadm_id'],
+                          right_on=['SUBJECT_ID', 'HADM_ID']).drop(columns=['SUBJECT_ID', 'HADM_ID'])
+        joined[cols] = joined[cols].fillna(0).astype(table[cols].dtypes.to_dict())
+    return joined
@@ -0,0 +1,231 @@
+## Readers for the MIMIC-III Source Tables
+
+### Import Necessary Packages
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+import tables
+
+from AF_cache import run_stage
+
+
+### Column types the MIMIC-III tables are read with (only these columns are read)
+# --> ids fit in int32, ICD-9 codes and other short repeated strings are categoricals (read as strings, so
+#     PROCEDURES_ICD codes keep any leading zeros), and dates stay as text until a stage parses them
+SOURCE_SCHEMAS = {
+    'PROCEDURES_ICD': {'SUBJECT_ID': 'int32', 'HADM_ID': 'int32', 'ICD9_CODE': 'category'},
+    'DIAGNOSES_ICD': {'SUBJECT_ID': 'int32', 'HADM_ID': 'int32', 'ICD9_CODE': 'category'},
+    'ADMISSIONS': {'SUBJECT_ID': 'int32', 'HADM_ID': 'int32', 'ADMITTIME': 'str', 'ADMISSION_TYPE': 'category'},
+    'PATIENTS': {'SUBJECT_ID': 'int32', 'GENDER': 'category', 'DOB': 'str'},
+}
+# --> the id columns of the MIMIC-Extract vitals
+VITALS_ID_SCHEMA = {'subject_id': 'int32', 'hadm_id': 'int32'}
+# --> the columns of NOTEEVENTS read while streaming the discharge summaries (HADM_ID is missing for some notes)
+NOTES_SCHEMA = {'SUBJECT_ID': 'int32', 'HADM_ID': 'float64', 'CATEGORY': 'category', 'ISERROR': 'float32',
+                'TEXT': 'str'}
+
+### Column types of the files handed from one processing step to the next
+# --> na_creatinine and imp_creatinine (one row per CABG admission)
+DEMOGRAPHICS_SCHEMA = {'subject_id': 'int32', 'hadm_id': 'int32', 'height': 'float64', 'weight': 'float64',
+                       'creatinine': 'float64', 'gender': 'category', 'age': 'int16'}
+# --> risk (the dashboard's reference dataset): 0/1 indicators as uint8, text features as bool, scores as int8
+RISK_SCHEMA = dict(DEMOGRAPHICS_SCHEMA, eGFR='float64',
+                   **{col: 'uint8' for col in ['chf', 'hbp', 'dm', 'stroke', 'vd', 'pvd', 'lad', 'copd', 'MI', 'AF',
+                                               'iabp', 'cvas', 'dialysis', 'emergency', 'mmvd', 'smvd']},
+                   **{col: 'bool' for col in ['moderate_mitral', 'severe_mitral', 'ef_mention']},
+                   **{col: 'int8' for col in ['poaf', 'chads', 'afri', 'npoaf', 'simplified', 'comaf']})
+HANDOFF_FORMATS = {'parquet': '.parquet', 'csv': '.csv'}
+
+
+### Establish a function to give the columns of a dataframe the types of a schema (other columns are left as they are)
+def apply_schema(df, schema):
+    return df.astype({col: dtype for col, dtype in schema.items() if col in df.columns})
+
+
+### Establish a function to parse a MIMIC-III table
+# --> the table's columns and types come from SOURCE_SCHEMAS, looked up by file name; other tables are read whole
+def read_source(path):
+    schema = SOURCE_SCHEMAS.get(os.path.basename(path).split('.')[0])
+    if schema is None:
+        return pd.read_csv(path, compression='infer')
+    return pd.read_csv(path, compression='infer', usecols=list(schema), dtype=schema)
+
+
+### Establish a function to start reading several MIMIC-III tables at once
+# --> paths maps a name to each table's file; returns a dict of futures so each stage can wait for (.result()) just
+#     the tables it needs while the others are still being read
+# --> the tables are read on a pool of threads (gzip and the csv parser release the GIL for most of the work); with
+#     a cache_dir each parsed table is kept as parquet in the stage cache, so the next processing script (and later
+#     runs) load it from there instead of parsing the csv again
+def load_tables(paths, cache_dir=None, max_bytes=2 * 1024**3, threads=None):
+    pool = ThreadPoolExecutor(max_workers=threads or min(len(paths), os.cpu_count() or 1))
+    futures = {name: pool.submit(run_stage, 'source_' + name, read_source, [path], cache_dir, max_bytes)
+               for name, path in paths.items()}
+    pool.shutdown(wait=False)
+    with _loading_lock:
+        _loading.update(futures.values())
+    for future in futures.values():
+        future.add_done_callback(_loaded)
+    return futures
+
+
+### Tables load_tables is still reading
+_loading = set()
+_loading_lock = threading.Lock()
+
+def _loaded(future):
+    with _loading_lock:
+        _loading.discard(future)
+
+
+### Establish a function to wait until every table started by load_tables has been read
+# --> call before forking worker processes: a fork copies the locks the reader threads hold at that moment (in
+#     gzip, pandas, or logging) and a child that needs one of them would wait forever
+def wait_for_loaders():
+    with _loading_lock:
+        pending = list(_loading)
+    wait(pending)
+
+
+### Establish a function to stream the discharge summaries for a cohort out of NOTEEVENTS
+# --> the notes table is read chunksize rows at a time and each chunk is reduced to non-error discharge
+#     summaries for the cohort's (SUBJECT_ID, HADM_ID) pairs before the next one is read, so peak memory
+#     depends on chunksize and the cohort's notes rather than on the size of NOTEEVENTS
+# --> cohort is any dataframe with subject/admission id columns (upper or lower case names)
+def read_discharge_notes(path, cohort, chunksize=100000):
+    ids = cohort.rename(columns=str.upper)[['SUBJECT_ID', 'HADM_ID']].dropna().astype('int32')
+    pairs = pd.MultiIndex.from_frame(ids.drop_duplicates())
+    kept = []
+    reader = pd.read_csv(path, compression='infer', chunksize=chunksize, usecols=list(NOTES_SCHEMA), dtype=NOTES_SCHEMA)
+    for chunk in reader:
+        chunk = chunk.loc[(chunk['CATEGORY']=="Discharge summary")&
+                          ((chunk['ISERROR'].isnull())|
+                           (chunk['ISERROR']==0))&
+                          (chunk['HADM_ID'].notnull())]
+        chunk = chunk.astype({'SUBJECT_ID': 'int32', 'HADM_ID': 'int32'})
+        in_cohort = pd.MultiIndex.from_frame(chunk[['SUBJECT_ID', 'HADM_ID']]).isin(pairs)
+        kept.append(chunk.loc[in_cohort, ['SUBJECT_ID', 'HADM_ID', 'TEXT']])
+    if not kept:
+        return pd.DataFrame(columns=['SUBJECT_ID', 'HADM_ID', 'TEXT']).astype({'SUBJECT_ID': 'int32', 'HADM_ID': 'int32'})
+    return pd.concat(kept, ignore_index=True)
+
+
+### Establish a function to read a stored array, decoding byte strings
+def _h5_values(node):
+    values = node.read()
+    if values.dtype.kind == 'S':
+        values = np.char.decode(values, 'utf-8')
+    return values
+
+
+### Establish a function to read the levels and label nodes of a MultiIndex stored in pandas' fixed HDF5 format
+# --> label nodes are returned unread so that only the levels that are needed get loaded
+def _h5_multiindex(group, prefix):
+    nlevels = int(group._v_attrs[prefix + '_nlevels'])
+    levels = [_h5_values(group._f_get_child(f'{prefix}_level{i}')) for i in range(nlevels)]
+    names = [group._f_get_child(f'{prefix}_level{i}')._v_attrs.name for i in range(nlevels)]
+    labels = [group._f_get_child(f'{prefix}_label{i}') for i in range(nlevels)]
+    return levels, labels, names
+
+
+### Establish a function to turn a boolean row mask into (start, stop) runs of consecutive rows
+def _runs(mask):
+    edges = np.diff(np.concatenate([[0], mask.astype('int8'), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+### Establish a function to read selected vitals for a cohort from the MIMIC-Extract output file
+# --> only the (item, agg) columns and the rows of the cohort's subjects are read from disk: the subject_id
+#     labels of the row index select runs of rows and each run is read as an HDF5 hyperslab of just those columns
+# --> returns a flat dataframe with subject_id and hadm_id (int32) and one column per item
+def read_vitals(path, cohort, items=('height', 'weight', 'creatinine'), key='vitals_labs_mean', agg='mean'):
+    subjects = pd.unique(cohort.rename(columns=str.lower)['subject_id'])
+    with tables.open_file(path, mode='r') as h5:
+        group = h5.get_node('/' + key)
+        attrs = group._v_attrs
+        layout = (attrs.pandas_type, getattr(attrs, 'axis0_variety', None), getattr(attrs, 'axis1_variety', None))
+        if layout != ('frame', 'multi', 'multi'):
+            return _read_vitals_pandas(path, key, subjects, items, agg, table=attrs.pandas_type == 'frame_table')
+
+        # --> find the block and position of each requested column
+        columns = {}
+        for b in range(int(attrs.nblocks)):
+            levels, labels, _ = _h5_multiindex(group, f'block{b}_items')
+            names = levels[0][labels[0].read()]
+            aggs = levels[1][labels[1].read()] if len(levels) > 1 else np.full(len(names), agg)
+            for pos, (name, func) in enumerate(zip(names, aggs)):
+                if name in items and func == agg:
+                    columns[name] = (group._f_get_child(f'block{b}_values'), pos)
+        missing = [item for item in items if item not in columns]
+        if missing:
+            raise KeyError(f'{missing} not found in {key} of {path}')
+
+        # --> select the rows of the cohort's subjects from the subject_id level of the row index
+        levels, labels, names = _h5_multiindex(group, 'axis1')
+        subject_level, hadm_level = names.index('subject_id'), names.index('hadm_id')
+        subject_codes = labels[subject_level].read()
+        mask = np.isin(subject_codes, np.flatnonzero(np.isin(levels[subject_level], subjects)))
+        runs = _runs(mask)
+        rows = np.flatnonzero(mask)
+
+        # --> read each run of rows for just the requested columns
+        data = {'subject_id': levels[subject_level][subject_codes[rows]],
+                'hadm_id': levels[hadm_level][labels[hadm_level].read()[rows]]}
+        for item in items:
+            node, pos = columns[item]
+            parts = [node[start:stop, pos] for start, stop in runs]
+            data[item] = np.concatenate(parts) if parts else np.empty(0, dtype=node.dtype)
+    return apply_schema(pd.DataFrame(data), VITALS_ID_SCHEMA)
+
+
+### Establish a function to read the vitals with pandas when the file is not in the MIMIC-Extract layout
+# --> table-format files are still filtered to the cohort's subjects on disk with a where query
+def _read_vitals_pandas(path, key, subjects, items, agg, table=False):
+    if table:
+        subjects = [int(subject) for subject in subjects]
+        extract = pd.read_hdf(path, key, where='subject_id=subjects')
+    else:
+        extract = pd.read_hdf(path, key)
+    if isinstance(extract.columns, pd.MultiIndex):
+        extract = extract.xs(agg, axis=1, level=1)
+    extract = extract[list(items)].reset_index()
+    extract = extract.loc[extract['subject_id'].isin(subjects), ['subject_id', 'hadm_id'] + list(items)]
+    return apply_schema(extract.reset_index(drop=True), VITALS_ID_SCHEMA)
+
+
+### Establish a function to write a hand-off file with the column types of its schema
+# --> path has no extension; fmt 'parquet' stores the types with the data, 'csv' is kept for use outside Python
+#     (AF_impute.R reads na_creatinine.csv)
+# --> schema columns come first in schema order, any other columns follow with their own types
+def write_table(df, path, schema, fmt='parquet'):
+    missing = [col for col in schema if col not in df.columns]
+    if missing:
+        raise KeyError(f'{missing} missing from the data for {path}')
+    df = apply_schema(df[list(schema) + [col for col in df.columns if col not in schema]], schema)
+    if fmt == 'parquet':
+        df.to_parquet(path + HANDOFF_FORMATS[fmt], index=False)
+    elif fmt == 'csv':
+        df.to_csv(path + HANDOFF_FORMATS[fmt], index=False)
+    else:
+        raise ValueError(f'unknown hand-off format {fmt!r}, expected one of {list(HANDOFF_FORMATS)}')
+
+
+### Establish a function to read a hand-off file written by write_table (or by AF_impute.R)
+# --> path has no extension; the most recently written of the parquet and csv files is read
+# --> the data is given the types of the schema (files written before the schema changed are read with its types
+#     too), and row-number columns left by other writers of csv files are dropped
+def read_table(path, schema=None):
+    found = [path + ext for ext in HANDOFF_FORMATS.values() if os.path.exists(path + ext)]
+    if not found:
+        raise FileNotFoundError(f'no {" or ".join(HANDOFF_FORMATS)} file found for {path}')
+    latest = max(found, key=os.path.getmtime)
+    if latest.endswith('.parquet'):
+        df = pd.read_parquet(latest)
+    else:
+        df = pd.read_csv(latest)
+        df = df.drop(columns=[col for col in df.columns if col in ('X', 'index') or col.startswith('Unnamed:')])
+    if schema is not None:
+        df = apply_schema(df, schema)
+    return df
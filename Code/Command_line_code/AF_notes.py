@@ -0,0 +1,79 @@
+## Text-derived Indicators from the Discharge Summaries
+
+### Import Necessary Packages
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import ahocorasick
+import numpy as np
+import pandas as pd
+
+from AF_io import wait_for_loaders
+
+### Phrases to look for in each discharge summary; every key becomes one boolean feature per admission
+# --> matching is case sensitive unless ignore_case=True, so list the spellings that should count
+NOTE_PHRASES = {
+    'mild': ['mild mitral'],
+    'moderate_mitral': ['moderate mitral'],
+    'severe_mitral': ['severe mitral'],
+    'ef_mention': ['ejection fraction', 'Ejection Fraction', 'EJECTION FRACTION', 'LVEF'],
+}
+
+
+### Establish a function to build one Aho-Corasick automaton matching every phrase of every feature
+def build_automaton(phrases, ignore_case=False):
+    automaton = ahocorasick.Automaton()
+    for i, words in enumerate(phrases.values()):
+        for word in words:
+            word = word.lower() if ignore_case else word
+            # --> a phrase listed under several features marks all of them
+            automaton.add_word(word, automaton.get(word, ()) + (i,))
+    automaton.make_automaton()
+    return automaton
+
+
+### Establish a function to scan a batch of notes in a single pass each
+# --> returns one row of feature flags per note
+def scan_texts(texts, automaton, n_features, ignore_case=False):
+    hits = np.zeros((len(texts), n_features), dtype=bool)
+    for row, text in enumerate(texts):
+        if not isinstance(text, str):
+            continue
+        if ignore_case:
+            text = text.lower()
+        for _, features in automaton.iter(text):
+            hits[row, list(features)] = True
+    return hits
+
+
+### Worker state for the process pool (set in the parent before the workers are forked)
+_worker = {}
+
+def _scan_batch(texts):
+    return scan_texts(texts, _worker['automaton'], _worker['n_features'], _worker['ignore_case'])
+
+
+### Establish a function to turn the discharge summaries into one row of boolean text features per admission
+# --> notes has SUBJECT_ID, HADM_ID and TEXT columns (as returned by AF_io.read_discharge_notes)
+# --> batches of batch_size notes are spread over a pool of processes (None uses every core); forked
+#     workers inherit the automaton and do not re-run the calling script, so on platforms without fork
+#     the scan runs in a single process
+def note_features(notes, phrases=NOTE_PHRASES, processes=None, batch_size=500, ignore_case=False):
+    features = list(phrases)
+    automaton = build_automaton(phrases, ignore_case)
+    texts = notes['TEXT'].tolist()
+    batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+
+    if processes == 1 or len(batches) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        results = [scan_texts(batch, automaton, len(features), ignore_case) for batch in batches]
+    else:
+        _worker.update(automaton=automaton, n_features=len(features), ignore_case=ignore_case)
+        # --> no reader threads may be running when the workers are forked (see AF_io.py)
+        wait_for_loaders()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork')) as pool:
+            results = list(pool.map(_scan_batch, batches))
+        _worker.clear()
+
+    hits = np.vstack(results) if results else np.zeros((0, len(features)), dtype=bool)
+    flags = pd.DataFrame(hits, columns=features, index=notes.index)
+    flags[['SUBJECT_ID', 'HADM_ID']] = notes[['SUBJECT_ID', 'HADM_ID']]
+    return flags.groupby(['SUBJECT_ID', 'HADM_ID'], as_index=False)[features].any()
@@ -1,138 +1,223 @@
 ## MIMIC-III Data Processing
 
 ### Import Necessary Packages
-import pandas as pd 
+import pandas as pd
 import numpy as np
 from datetime import datetime
-import sqlite3
-
-### Read in procedures table from MIMIC-III
-procedures = pd.read_csv('../../Data/MIMIC-III/PROCEDURES_ICD.csv.gz', compression='gzip')
-
-### Select the subjects and admissions with CABG procedure codes
-cabg = procedures.loc[procedures['ICD9_CODE'].isin([3610,3611,3612,
-                                                    3613,3614,3615,
-                                                    3616,3617,3619])].drop(columns=['ROW_ID',
-                                                                                'SEQ_NUM',
-                                                                                'ICD9_CODE']).drop_duplicates()
-
-### Import the vital_labs_mean table from the MIMIC-Extract output file
-extract = pd.read_hdf('../../Data/MIMIC-Extract/all_hourly_data.h5', 'vitals_labs_mean')
-
-### Convert the extract table from pivot style to a flat dataframe
-extract_flat = pd.DataFrame(extract.to_records())
-extract_flat.columns = [hdr.replace("('", "").replace("', 'mean')", "") \
-                     for hdr in extract_flat.columns]
-
-### Select the relevant vital measurements from the extract dataframe
-extract_items = extract_flat[['subject_id', 'hadm_id', 'height', 'weight', 'creatinine']]
-
-### Merge cabg and extract_items to select CABG admissions within the extract vital measurement dataframe
-cabg_extract = pd.merge(cabg, extract_items, how='left', left_on=['SUBJECT_ID', 'HADM_ID'], 
-                        right_on=['subject_id','hadm_id']).drop(columns=['subject_id','hadm_id'])
-
-### Aggregate the median measurement for each admission and convert from a pivot format to a flat dataframe
-median_extract = cabg_extract.groupby(['SUBJECT_ID','HADM_ID'], as_index=False).median()
-median_ext_flat = pd.DataFrame(median_extract.to_records())
-
-### Aggregate the median measurement for each subject for imputation and convert from a pivot format to a flat dataframe
-sub_med_extract = cabg_extract.groupby(['SUBJECT_ID'], as_index=False).median()
-sub_med_ext_flat = pd.DataFrame(sub_med_extract.to_records())
-
-### Merge median_ext_flat and sub_med_ext_flat and impute subject aggregated medians to null values for the same subject
-# --> merge tables
-sub_med_merge = pd.merge(median_ext_flat, sub_med_ext_flat, how='inner', 
-                         on=['SUBJECT_ID']).drop(columns=['index_x','HADM_ID_y'])
-
-# --> fill null values based on subject median
-sub_med_merge['height_x'].fillna(sub_med_merge['height_y'], inplace=True)
-sub_med_merge['weight_x'].fillna(sub_med_merge['weight_y'], inplace=True)
-sub_med_merge['creatinine_x'].fillna(sub_med_merge['creatinine_y'], inplace=True)
-
-# --> remove duplicate columns and rename
-sub_med_filled = sub_med_merge.drop(columns=['index_y', 'height_y', 
-                            'weight_y', 'creatinine_y']).rename(columns={'HADM_ID_x': 'HADM_ID', 'height_x': 'height', 
-                                                                         'weight_x': 'weight', 
-                                                                         'creatinine_x': 'creatinine'})
-
-### Read in admissions and patients tables from MIMIC-III
-admissions = pd.read_csv('../../Data/MIMIC-III/ADMISSIONS.csv.gz', compression='gzip').drop(columns=['ROW_ID'])
-patients = pd.read_csv('../../Data/MIMIC-III/PATIENTS.csv.gz', compression='gzip').drop(columns=['ROW_ID'])
-
-### Merge admissions and patients and calculate age at admission for each subject
-# --> convert DOB and ADMITTIME to datetime format
-admissions['ADMITTIME'] = pd.to_datetime(admissions['ADMITTIME'], format='%Y-%m-%dT%H:%M:%S').dt.date
-patients['DOBTIME'] = pd.to_datetime(patients['DOB'], format='%Y-%m-%dT%H:%M:%S').dt.date
-
-# --> merge tables
-adm_pat = pd.merge(admissions, patients, how='inner', on=['SUBJECT_ID'])
-
-# --> calculate age at admission
-adm_pat['age'] = adm_pat.apply(lambda e: (e['ADMITTIME'] - e['DOBTIME']).days/365, axis=1)
-adm_pat['age'] = adm_pat['age'].astype('int64')
-
-# --> select the relevant columns
-adm_pat_cols=adm_pat[['SUBJECT_ID','HADM_ID','GENDER','age']]
-
-### Merge sub_med_merge with adm_pat_cols to determine age and gender of subjects
-patient_merge = pd.merge(sub_med_filled, adm_pat_cols, how='left', on=['SUBJECT_ID', 'HADM_ID'])
-
-### Create age groups for imputation
-# --> make a db in memory for sql queries
-conn = sqlite3.connect(':memory:')
-# --> write the dataframe to sql
-patient_merge.to_sql('patient_merge', conn, index=False)
-
-# --> write the sql query
-qry1 = '''
-    select
-        SUBJECT_ID,
-        HADM_ID,
-        height,
-        weight,
-        creatinine,
-        GENDER,
-        age,
-        case
-            when age <= 46 then 1
-            when age between 47 and 55 then 2
-            when age between 56 and 65 then 3
-            when age between 66 and 75 then 4
-            when age between 76 and 90 then 5
-            else 6
-            end as age_group
-    from patient_merge
-    order by 
-        GENDER,
-        age_group
-'''
-
-# --> run the sql query and create a pandas dataframe
-age_group = pd.read_sql_query(qry1, conn)
-
-### Calculate median height and weight by age and gender and convert from a pivot format to a flat dataframe
-med_a_g = age_group.groupby(['age_group', 'GENDER'], as_index=False).median()
-med_a_g_flat = pd.DataFrame(med_a_g.to_records())
-
-### Impute height and weight by age and gender from med_a_g_flat
-# --> merge tables
-a_g_merge = pd.merge(age_group, med_a_g_flat, how='left', 
-                     on=['age_group','GENDER']
-                    ).drop(columns=['index','SUBJECT_ID_y', 'HADM_ID_y', 'creatinine_y', 'age_y', 'age_group'])
-
-# --> fill null values based on age/gender median
-a_g_merge['height_x'].fillna(a_g_merge['height_y'], inplace=True)
-a_g_merge['weight_x'].fillna(a_g_merge['weight_y'], inplace=True)
-
-# --> remove duplicate columns and rename
-a_g_filled = a_g_merge.drop(columns=['height_y',
-                                     'weight_y']).rename(columns={'SUBJECT_ID_x': 'subject_id',
-                                                                  'HADM_ID_x': 'hadm_id', 
-                                                                  'GENDER': 'gender',
-                                                                  'height_x': 'height',
-                                                                  'weight_x': 'weight',
-                                                                  'creatinine_x': 'creatinine',
-                                                                  'age_x': 'age'})
-
-### Export the h_w_dropna dataset to impute creatinine values in R using the MICE package (see attached R code for imputation)
-a_g_filled.to_csv('../../Data/MIMIC-III/na_creatinine.csv')
+
+from AF_cache import run_stage
+from AF_delta import delta_admissions, group_medians, load_state, median_counts, merge_counts, merge_delta, save_state
+from AF_impute import mice
+from AF_indicators import icd_strings
+from AF_io import DEMOGRAPHICS_SCHEMA, load_tables, read_table, read_vitals, write_table
+from AF_report import track, write_report
+
+### Pipeline settings
+# --> impute creatinine in-process (True) or export na_creatinine.csv for AF_impute.R (False)
+native_imputation = True
+# --> number of chained-equation imputations run and the iterations run for each; the first completed dataset is
+#     written to imp_creatinine, as R's complete() does, and its values do not depend on n_imputations (each
+#     imputation has its own random stream), so more imputations only help when estimates are pooled across them
+n_imputations = 1
+imputation_iterations = 5
+# --> seed for the imputations, so reruns on the same data give the same imp_creatinine.csv
+imputation_seed = 0
+# --> worker processes used to run the imputations (None uses every core)
+imputation_processes = None
+# --> format of the files handed to the next step: 'parquet' (typed, fast) or 'csv'
+handoff_format = 'parquet'
+# --> directory for the stage cache (None re-runs every stage) and its size limit in bytes (see AF_cache.py)
+cache_dir = '../../Data/cache'
+cache_max_bytes = 2 * 1024**3
+# --> threads reading the MIMIC-III tables (None uses one per table, up to the number of cores)
+loader_threads = None
+# --> directory for the JSON run reports (timings, memory, and row counts of every stage and step, see AF_report.py)
+report_dir = '../../Data/reports'
+# --> process only the CABG admissions that are not in the last run's imp_creatinine, plus those listed in
+#     changed_admissions (a csv with a HADM_ID column, or None), and merge them into the existing outputs
+#     (needs native_imputation; set incremental = True in AF_process_post_impute.py as well)
+incremental = False
+changed_admissions = None
+
+
+### CABG cohort stage
+# --> select the subjects and admissions with CABG procedure codes from the procedures table
+# --> the codes are compared as strings, the way AF_io.py reads them
+def cabg_cohort(procedures):
+    return procedures.loc[icd_strings(procedures['ICD9_CODE']).isin(['3610','3611','3612',
+                                                                     '3613','3614','3615',
+                                                                     '3616','3617','3619']),
+                          ['SUBJECT_ID', 'HADM_ID']].drop_duplicates()
+
+
+### Vitals extract stage
+# --> read height, weight, and creatinine for the CABG subjects from the vital_labs_mean table of the MIMIC-Extract output file
+# --> only those three columns and the CABG subjects' rows are read from disk (see AF_io.py)
+def vitals_extract(h5_path, cabg):
+    return read_vitals(h5_path, cabg, items=['height', 'weight', 'creatinine'], key='vitals_labs_mean')
+
+
+### Demographics stage
+# --> one row per CABG admission with median vitals (gaps filled from the subject's other admissions), gender,
+#     age at admission, and age group
+def demographics(cabg, extract_items, admissions, patients):
+    ### Merge cabg and extract_items to select CABG admissions within the extract vital measurement dataframe
+    cabg_extract = track('merge cabg x vitals', pd.merge, cabg, extract_items, how='left', left_on=['SUBJECT_ID', 'HADM_ID'],
+                         right_on=['subject_id','hadm_id']).drop(columns=['subject_id','hadm_id'])
+
+    ### Aggregate the median measurement for each admission and convert from a pivot format to a flat dataframe
+    median_extract = track('admission medians', lambda df: df.groupby(['SUBJECT_ID','HADM_ID'], as_index=False).median(),
+                           cabg_extract)
+    median_ext_flat = pd.DataFrame(median_extract.to_records())
+
+    ### Aggregate the median measurement for each subject for imputation and convert from a pivot format to a flat dataframe
+    sub_med_extract = track('subject medians', lambda df: df.groupby(['SUBJECT_ID'], as_index=False).median(),
+                            cabg_extract)
+    sub_med_ext_flat = pd.DataFrame(sub_med_extract.to_records())
+
+    ### Merge median_ext_flat and sub_med_ext_flat and impute subject aggregated medians to null values for the same subject
+    # --> merge tables
+    sub_med_merge = track('merge admission x subject medians', pd.merge, median_ext_flat, sub_med_ext_flat, how='inner',
+                          on=['SUBJECT_ID']).drop(columns=['index_x','HADM_ID_y'])
+
+    # --> fill null values based on subject median
+    for col in ['height', 'weight', 'creatinine']:
+        sub_med_merge[col + '_x'] = sub_med_merge[col + '_x'].fillna(sub_med_merge[col + '_y'])
+
+    # --> remove duplicate columns and rename
+    sub_med_filled = sub_med_merge.drop(columns=['index_y', 'height_y',
+                                'weight_y', 'creatinine_y']).rename(columns={'HADM_ID_x': 'HADM_ID', 'height_x': 'height',
+                                                                             'weight_x': 'weight',
+                                                                             'creatinine_x': 'creatinine'})
+
+    ### Select the columns used from the admissions and patients tables
+    admissions = admissions[['SUBJECT_ID', 'HADM_ID', 'ADMITTIME']].copy()
+    patients = patients[['SUBJECT_ID', 'GENDER', 'DOB']].copy()
+
+    ### Merge admissions and patients and calculate age at admission for each subject
+    # --> convert DOB and ADMITTIME to day-resolution datetime64 arrays
+    #     (nanosecond differences overflow for the shifted DOBs, which are about 300 years before admission)
+    admissions['ADMITTIME'] = pd.to_datetime(admissions['ADMITTIME'], format='%Y-%m-%dT%H:%M:%S')
+    patients['DOBTIME'] = pd.to_datetime(patients['DOB'], format='%Y-%m-%dT%H:%M:%S')
+
+    # --> merge tables
+    adm_pat = track('merge admissions x patients', pd.merge, admissions, patients, how='inner', on=['SUBJECT_ID'])
+
+    # --> calculate age at admission in completed 365-day years
+    days = (adm_pat['ADMITTIME'].to_numpy().astype('datetime64[D]') -
+            adm_pat['DOBTIME'].to_numpy().astype('datetime64[D]')).astype('int64')
+    # --> patients older than 89, whose DOB MIMIC-III shifts, keep their apparent age of about 300 years as before
+    adm_pat['age'] = (days/365).astype('int16')
+
+    # --> select the relevant columns
+    adm_pat_cols=adm_pat[['SUBJECT_ID','HADM_ID','GENDER','age']]
+
+    ### Merge sub_med_merge with adm_pat_cols to determine age and gender of subjects
+    patient_merge = track('merge vitals x age/gender', pd.merge, sub_med_filled, adm_pat_cols, how='left',
+                          on=['SUBJECT_ID', 'HADM_ID'])
+
+    ### Create age groups for imputation
+    # --> age bands 1: <=46, 2: 47-55, 3: 56-65, 4: 66-75, 5: 76-90, 6: older or unknown
+    age_group = patient_merge[['SUBJECT_ID', 'HADM_ID', 'height', 'weight', 'creatinine', 'GENDER', 'age']].copy()
+    age = age_group['age']
+    age_group['age_group'] = np.select([age <= 46,
+                                        age.between(47, 55),
+                                        age.between(56, 65),
+                                        age.between(66, 75),
+                                        age.between(76, 90)],
+                                       [1, 2, 3, 4, 5], default=6)
+    age_group = age_group.sort_values(['GENDER', 'age_group'], kind='stable', na_position='first').reset_index(drop=True)
+
+    return age_group
+
+
+### Establish a function to impute height and weight by age and gender from the group medians
+# --> medians has one row per age group and gender (see AF_delta.group_medians)
+def fill_by_age_gender(age_group, medians):
+    # --> merge tables
+    a_g_merge = track('merge age/gender medians', pd.merge, age_group,
+                      medians.reindex(columns=['age_group', 'GENDER', 'height', 'weight']), how='left',
+                      on=['age_group','GENDER']).drop(columns=['age_group'])
+
+    # --> fill null values based on age/gender median
+    for col in ['height', 'weight']:
+        a_g_merge[col + '_x'] = a_g_merge[col + '_x'].fillna(a_g_merge[col + '_y'])
+
+    # --> remove duplicate columns and rename
+    return a_g_merge.drop(columns=['height_y',
+                                   'weight_y']).rename(columns={'SUBJECT_ID': 'subject_id',
+                                                                'HADM_ID': 'hadm_id',
+                                                                'GENDER': 'gender',
+                                                                'height_x': 'height',
+                                                                'weight_x': 'weight'})
+
+
+### Imputation stage
+# --> impute the remaining null values (mostly creatinine) by chained equations with predictive mean matching,
+#     running the imputations in parallel (see AF_impute.py), and keep the first completed dataset; averaging the
+#     imputations row by row would pull the imputed values towards the mean and off the observed donor values
+def imputation(a_g_filled, m, n_iter, seed, processes):
+    imputations = mice(a_g_filled, ['height', 'weight', 'creatinine', 'age', 'gender'], m=m,
+                       n_iter=n_iter, seed=seed, processes=processes)
+    return imputations[0]
+
+
+### Start reading the MIMIC-III tables concurrently (see AF_io.py); each stage waits only for the tables it uses
+source = load_tables({'procedures': '../../Data/MIMIC-III/PROCEDURES_ICD.csv.gz',
+                      'admissions': '../../Data/MIMIC-III/ADMISSIONS.csv.gz',
+                      'patients': '../../Data/MIMIC-III/PATIENTS.csv.gz'},
+                     cache_dir, cache_max_bytes, threads=loader_threads)
+
+### Run the stages, reusing the cached output of each stage whose inputs and code are unchanged
+cabg = run_stage('cabg_cohort', cabg_cohort, [source['procedures'].result()], cache_dir, cache_max_bytes)
+
+### In incremental mode only the new and changed admissions (and the other admissions of their subjects) are processed
+if incremental:
+    previous = read_table('../../Data/MIMIC-III/imp_creatinine', DEMOGRAPHICS_SCHEMA)
+    delta = delta_admissions(cabg, previous, changed_admissions)
+    cabg = cabg.loc[cabg['SUBJECT_ID'].isin(delta['SUBJECT_ID'])]
+
+extract_items = run_stage('vitals_extract', vitals_extract, ['../../Data/MIMIC-Extract/all_hourly_data.h5', cabg],
+                          cache_dir, cache_max_bytes)
+age_group = run_stage('demographics', demographics, [cabg, extract_items, source['admissions'].result(),
+                                                     source['patients'].result()],
+                      cache_dir, cache_max_bytes)
+
+### Calculate median height and weight by age and gender from the counts of observed values
+# --> an incremental run takes the stored counts, removes those of the reprocessed admissions, and adds the new ones
+counts = median_counts(age_group)
+stored_vitals = age_group
+if incremental:
+    stored_vitals = load_state('../../Data/MIMIC-III/admission_vitals')
+    counts = merge_counts(load_state('../../Data/MIMIC-III/median_counts'), add=counts,
+                          remove=median_counts(stored_vitals.loc[stored_vitals['HADM_ID'].isin(delta['HADM_ID'])]))
+    stored_vitals = merge_delta(stored_vitals, age_group, keys=['SUBJECT_ID', 'HADM_ID'])
+save_state(counts, '../../Data/MIMIC-III/median_counts')
+save_state(stored_vitals, '../../Data/MIMIC-III/admission_vitals')
+a_g_filled = fill_by_age_gender(age_group, group_medians(counts))
+
+### Export the imputed dataset for score calculation
+# --> with native_imputation = False the dataset is exported instead to impute creatinine in R using the MICE
+#     package (see AF_impute.R)
+if native_imputation:
+    # --> in incremental mode the previously imputed admissions take part as complete rows, so the models and
+    #     donors still come from the whole cohort, and the admissions processed are recorded for the next step
+    donors = previous.loc[~previous['hadm_id'].isin(a_g_filled['hadm_id'])] if incremental else None
+    imputed = run_stage('imputation', imputation, [pd.concat([donors, a_g_filled], ignore_index=True),
+                                                   n_imputations, imputation_iterations,
+                                                   imputation_seed, imputation_processes],
+                        cache_dir, cache_max_bytes)
+    if incremental:
+        imputed = imputed.loc[imputed['hadm_id'].isin(a_g_filled['hadm_id'])]
+        write_table(imputed, '../../Data/MIMIC-III/delta_creatinine', DEMOGRAPHICS_SCHEMA, fmt='parquet')
+        imputed = merge_delta(previous, imputed)
+    write_table(imputed, '../../Data/MIMIC-III/imp_creatinine', DEMOGRAPHICS_SCHEMA, fmt=handoff_format)
+else:
+    write_table(a_g_filled, '../../Data/MIMIC-III/na_creatinine', DEMOGRAPHICS_SCHEMA, fmt='csv')
+
+### Write the run report
+write_report(report_dir, 'AF_process', settings={'native_imputation': native_imputation, 'n_imputations': n_imputations,
+                                                 'imputation_iterations': imputation_iterations, 'imputation_seed': imputation_seed,
+                                                 'imputation_processes': imputation_processes, 'handoff_format': handoff_format,
+                                                 'cache_dir': cache_dir, 'incremental': incremental,
+                                                 'changed_admissions': changed_admissions, 'loader_threads': loader_threads})
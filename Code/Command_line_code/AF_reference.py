@@ -0,0 +1,308 @@
+## Reference Dataset Statistics for the Dashboard
+
+### Import Necessary Packages
+import base64
+import bisect
+import hashlib
+import io
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from AF_cache import evict, stage_key
+from AF_scores import CUT_POINTS, SCORES, percentile_lookup
+
+
+### Two-sided 95% quantile of the standard normal distribution
+Z_95 = 1.959963984540054
+
+
+### Establish a function to fit a logistic regression of an outcome on a score from grouped counts
+# --> the fit only needs, for each score level, how many patients are at it (trials) and how many of them had
+#     the outcome (events), so its cost grows with the number of levels rather than the number of patients
+# --> Newton-Raphson on the binomial log-likelihood, giving the same estimates as a logistic regression on one row
+#     per patient (statsmodels' Logit); returns the intercept and slope and their covariance matrix
+# --> returns None when the model cannot be estimated: no patients with (or without) the outcome, a single score
+#     level, or a score that separates the outcomes perfectly (the fit then does not converge)
+def grouped_logit(levels, events, trials, max_iter=100, tol=1e-10):
+    X = np.column_stack([np.ones(len(levels)), np.asarray(levels, dtype='float64')])
+    events = np.asarray(events, dtype='float64')
+    trials = np.asarray(trials, dtype='float64')
+    if len(levels) < 2 or events.sum() == 0 or events.sum() == trials.sum():
+        return None
+    beta = np.zeros(2)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        try:
+            for _ in range(max_iter):
+                p = 1 / (1 + np.exp(-(X @ beta)))
+                gradient = X.T @ (events - trials*p)
+                information = (X * (trials*p*(1 - p))[:, None]).T @ X
+                step = np.linalg.solve(information, gradient)
+                beta = beta + step
+                if np.abs(step).max() < tol:
+                    break
+            else:
+                return None
+            p = 1 / (1 + np.exp(-(X @ beta)))
+            covariance = np.linalg.inv((X * (trials*p*(1 - p))[:, None]).T @ X)
+        except np.linalg.LinAlgError:
+            return None
+    if not (np.isfinite(beta).all() and np.isfinite(covariance).all()):
+        return None
+    return beta, covariance
+
+
+### Establish a function to count the patients and the AF events at each level of a score
+# --> the one pass over the patients the validation statistics need: the ROC table, the logistic regression, and
+#     the histogram are all calculated from these counts (patients missing the score or the outcome are left out)
+def level_counts(score, af):
+    known = (score.notna() & af.isin([0, 1])).to_numpy()
+    levels, inverse = np.unique(score.to_numpy()[known], return_inverse=True)
+    events = np.bincount(inverse, weights=(af.to_numpy()[known]==1), minlength=len(levels))
+    trials = np.bincount(inverse, minlength=len(levels))
+    return levels, events, trials
+
+
+### Establish a function to tabulate the classification of every possible cut point of a score at once
+# --> a patient is classified as AF when their score is at or above the cut point; the AF and non-AF patients at or
+#     above each distinct score level are cumulative sums over the level_counts from the top, so TP and FP for every
+#     threshold come at once (a last entry, above the top level, classifies nobody as AF)
+# --> also returns the area under the ROC curve and the cut point with the highest Youden index
+#     (sensitivity + specificity - 1)
+def roc_table(levels, events, trials):
+    tp = np.append(np.cumsum(events[::-1])[::-1], 0)
+    fp = np.append(np.cumsum((trials - events)[::-1])[::-1], 0)
+    positives, negatives = tp[0], fp[0]
+    ### --> ROC curve from the highest threshold (nobody classified as AF) to the lowest (everybody)
+    tpr = (tp / max(positives, 1))[::-1]
+    fpr = (fp / max(negatives, 1))[::-1]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    youden = tp[:-1] / max(positives, 1) - fp[:-1] / max(negatives, 1)
+    return {'levels': levels.tolist(), 'tp': tp.astype('int64').tolist(), 'fp': fp.astype('int64').tolist(),
+            'positives': int(positives), 'negatives': int(negatives), 'auc': auc,
+            'youden_cut': levels[np.argmax(youden)].item() if len(levels) else None}
+
+
+### Establish a function to look up the classification at one cut point in a roc_table
+# --> the counts at the first score level at or above the cut point
+def cut_metrics(roc, cut):
+    i = bisect.bisect_left(roc['levels'], cut)
+    TP, FP = roc['tp'][i], roc['fp'][i]
+    return {'TP': TP, 'FP': FP, 'FN': roc['positives'] - TP, 'TN': roc['negatives'] - FP}
+
+
+### Establish a function to calculate the validation statistics of one score against the AF outcome
+# --> all from the level_counts of the score: the classification at every cut point (see roc_table) and the
+#     default cut point, the odds ratio per score point with its 95% CI, and the histogram of the score by outcome
+#     (share of each outcome's patients at each score level, drawn as bars so the rows never leave the server)
+def score_stats(df, name):
+    cut = CUT_POINTS[name]
+    levels, events, trials = level_counts(df[name], df['AF'])
+    ### --> tabulate totals for TP, FP, FN, and TN at every cut point
+    roc = roc_table(levels, events, trials)
+    ### --> bulid the logistic regression model from the AF events and patients at each score level
+    # --> the odds ratio and its CI are NaN when the model cannot be estimated (see grouped_logit)
+    fit = grouped_logit(levels, events, trials)
+    if fit is None:
+        odds_ratio, ci = float('nan'), [float('nan'), float('nan')]
+    else:
+        beta, covariance = fit
+        se = np.sqrt(covariance[1, 1])
+        odds_ratio, ci = float(np.exp(beta[1])), [float(np.exp(beta[1] - Z_95*se)), float(np.exp(beta[1] + Z_95*se))]
+    ### --> share of each outcome's patients at each score level
+    histogram = {'levels': levels.tolist()}
+    for counts, label in [(trials - events, 'no'), (events, 'yes')]:
+        histogram[label] = (counts / max(counts.sum(), 1)).tolist()
+    return {'cut': cut, 'roc': roc, 'odds_ratio': odds_ratio, 'ci': ci, 'histogram': histogram}
+
+
+### Establish a function to count the patients at each pair of scores by AF outcome
+# --> one row per (x score, y score, AF) combination that occurs, with its count in the column n; the comparison
+#     graph draws these instead of a point per patient for large reference datasets
+def pair_counts(df, xaxis, yaxis):
+    counts = df.groupby([df[xaxis].rename('x'), df[yaxis].rename('y'), df['AF'].rename('AF')], observed=True).size()
+    return counts.rename('n').reset_index()
+
+
+### Establish a function to calculate every statistic the dashboard shows for a reference dataset
+# --> the percentile lookup (see AF_scores.py) and score_stats for each score the dataset has
+# --> each score is calculated on its own, so a score whose statistics cannot be calculated (such as a text column in
+#     an upload) is left as None, with the reason under 'errors', and the other scores are still shown
+def reference_stats(df):
+    stats = {'lookup': percentile_lookup(df), 'scores': {}, 'errors': {}}
+    for name in SCORES:
+        if name not in df:
+            continue
+        try:
+            stats['scores'][name] = score_stats(df, name)
+        except Exception as e:
+            warnings.warn(f'statistics of {name} could not be calculated: {e}')
+            stats['scores'][name] = None
+            stats['errors'][name] = str(e)
+    return stats
+
+
+### Statistics of the reference datasets used most recently, newest last
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+### Cache keys of the statistics of the stored uploads, by upload token
+_stats_keys = {}
+
+
+### Establish a function for the cache key of a reference dataset's statistics
+# --> hashing the code of reference_stats takes milliseconds, so the key of a dataset with a data_key (an upload's
+#     token) is calculated once, when the upload is stored, and then looked up by the token
+def _stats_key(df, data_key=None):
+    if data_key is None:
+        return stage_key('reference_stats', reference_stats, [df])
+    with _lock:
+        key = _stats_keys.get(data_key)
+    if key is None:
+        key = stage_key('reference_stats', reference_stats, [data_key])
+        with _lock:
+            _stats_keys[data_key] = key
+    return key
+
+
+### Establish a function to get the statistics of a reference dataset, calculating them only once per dataset
+# --> keyed by the dataset's content and the code of reference_stats (see AF_cache.stage_key), so an edited
+#     statistic is recalculated; the max_entries most recently used datasets are kept in memory
+# --> data_key stands in for the dataset's content when it is already known (such as an upload's key), which
+#     saves hashing every row
+# --> with a cache_dir they are also stored there as JSON, so a restarted dashboard starts warm, and the least
+#     recently used files are removed once they take more than max_bytes
+def cached_reference_stats(df, cache_dir=None, max_bytes=64 * 1024**2, max_entries=8, data_key=None):
+    key = _stats_key(df, data_key)
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+
+    path = None if cache_dir is None else os.path.join(cache_dir, f'reference_stats-{key}.json')
+    if path is not None and os.path.exists(path):
+        # --> mark the entry as recently used for eviction
+        os.utime(path)
+        with open(path) as f:
+            stats = json.load(f)
+    else:
+        stats = reference_stats(df)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp, path)
+            evict(cache_dir, max_bytes, keep=path, suffix='.json')
+
+    with _lock:
+        _memory[key] = stats
+        while len(_memory) > max_entries:
+            _memory.popitem(last=False)
+    return stats
+
+
+### Establish a function to parse an uploaded reference dataset (the contents of a dcc.Upload)
+# --> csv, text (delimited by commas, tabs, or another separator, which is detected), and Excel files are read;
+#     anything else gives None
+# --> a file that cannot be parsed raises a ValueError whose message says why, to show to the user
+def parse_upload(contents, filename):
+    content_type, content_string = contents.split(',')
+
+    decoded = base64.b64decode(content_string)
+    try:
+        if 'csv' in filename:
+            # Assume that the user uploaded a CSV file
+            return pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+        elif 'txt' in filename:
+            # Assume that the user uploaded a delimited text file
+            return pd.read_csv(io.StringIO(decoded.decode('utf-8')), sep=None, engine='python')
+        elif 'xls' in filename:
+            # Assume that the user uploaded an excel file
+            return pd.read_excel(io.BytesIO(decoded))
+    except Exception as e:
+        warnings.warn(f'upload {filename} could not be read: {e}')
+        raise ValueError(f'{filename} could not be read: {e}') from e
+    return None
+
+
+### Parsed uploads, newest last, and the memory they take
+_uploads = OrderedDict()
+_upload_bytes = {}
+
+
+### Establish a function to keep a parsed upload in memory
+# --> the least recently used uploads are dropped once the parsed dataframes take more than max_bytes of memory
+#     (the newest upload is always kept)
+def _remember(key, df, max_bytes):
+    with _lock:
+        _uploads[key] = df
+        _upload_bytes[key] = int(df.memory_usage(index=True, deep=True).sum())
+        while len(_uploads) > 1 and sum(_upload_bytes.values()) > max_bytes:
+            oldest, _ = _uploads.popitem(last=False)
+            del _upload_bytes[oldest]
+            _stats_keys.pop(oldest, None)
+
+
+### Establish a function to store an uploaded reference dataset on the server, parsing it only once
+# --> returns the upload's token (a hash of its contents and file name), which is all the browser needs to keep
+#     and send back, or None when the file is not a type parse_upload reads (one it cannot parse raises a ValueError)
+# --> the parsed dataframe is kept in memory (see _remember) and, with a cache_dir, as parquet there so the token
+#     still works after it is dropped from memory or the dashboard restarts; the least recently used files are
+#     removed once they take more than disk_max_bytes
+# --> the statistics of a new upload are calculated here, before the token is returned (see cached_reference_stats,
+#     with stats_cache_dir and stats_max_bytes), so the callbacks that take the token only look them up
+def store_upload(contents, filename, cache_dir=None, max_bytes=512 * 1024**2, disk_max_bytes=2 * 1024**3,
+                 stats_cache_dir=None, stats_max_bytes=64 * 1024**2):
+    key = hashlib.blake2b(f'{filename}\n{contents}'.encode(), digest_size=16).hexdigest()
+    if upload_data(key, cache_dir, max_bytes) is not None:
+        return key
+    df = parse_upload(contents, filename)
+    if df is None:
+        return None
+    _remember(key, df, max_bytes)
+    cached_reference_stats(df, stats_cache_dir, stats_max_bytes, data_key=key)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f'upload-{key}.parquet')
+        tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            df.to_parquet(tmp)
+        except (ValueError, TypeError) as e:
+            # --> columns parquet cannot store (such as mixed types) keep the upload in memory only (see upload_on_disk)
+            warnings.warn(f'upload {key} is kept in memory only: {e}')
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return key
+        os.replace(tmp, path)
+        evict(cache_dir, disk_max_bytes, keep=path)
+    return key
+
+
+### Establish a function to check whether a stored upload also has a copy in cache_dir
+# --> an upload without one is lost once it is dropped from memory or the dashboard restarts
+def upload_on_disk(key, cache_dir):
+    return cache_dir is not None and os.path.exists(os.path.join(cache_dir, f'upload-{key}.parquet'))
+
+
+### Establish a function to look up a stored upload by its token
+# --> every callback shares the same dataframe: treat it as read-only (with copy-on-write, the default from
+#     pandas 3, changes go to a copy)
+# --> returns None for a token that is no longer stored
+def upload_data(key, cache_dir=None, max_bytes=512 * 1024**2):
+    with _lock:
+        if key in _uploads:
+            _uploads.move_to_end(key)
+            return _uploads[key]
+    path = None if cache_dir is None else os.path.join(cache_dir, f'upload-{key}.parquet')
+    if path is None or not os.path.exists(path):
+        return None
+    # --> mark the file as recently used for eviction
+    os.utime(path)
+    df = pd.read_parquet(path)
+    _remember(key, df, max_bytes)
+    return df
@@ -0,0 +1,133 @@
+## Run Report for the Processing Scripts
+
+### Import Necessary Packages
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # --> not available on Windows; peak memory is then left out of the report
+    resource = None
+
+
+### Steps recorded so far in this run, and the stage each thread is currently running
+_steps = []
+_lock = threading.Lock()
+_current = threading.local()
+_started = {'time': time.time(), 'at': datetime.now().isoformat(timespec='seconds')}
+
+
+### Establish a function to read a memory figure of this process in MB from /proc (None where there is no /proc)
+def _proc_status(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+### Establish a function to read the peak resident memory of this process so far in MB
+# --> on Linux the peak is read from /proc, since ru_maxrss also counts the process that started this one
+#     (such as the benchmark in AF_benchmark.py)
+# --> ru_maxrss is in kB on Linux and in bytes on macOS; a step's delta is how far it raised the peak
+def _peak_rss():
+    peak = _proc_status('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    scale = 1 / 1024**2 if sys.platform == 'darwin' else 1 / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+### Establish a function to read the clocks at the start of a step
+# --> CPU time is this thread's plus that of worker processes, so steps running on other threads are not counted
+# --> rss_now is the resident memory of the process at this moment (VmRSS, Linux only)
+def snapshot():
+    children = os.times()
+    return {'wall': time.perf_counter(), 'cpu': time.thread_time() + children.children_user + children.children_system,
+            'rss': _peak_rss(), 'rss_now': _proc_status('VmRSS'), 'stage': getattr(_current, 'stage', None)}
+
+
+### Establish a function to count the rows of a step input or output (None for anything that is not a table)
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    return None
+
+
+### Establish a function to measure the memory held by a step's output table in MB (text included)
+def _table_mb(value):
+    if isinstance(value, pd.DataFrame):
+        return round(value.memory_usage(index=True, deep=True).sum() / 1024**2, 2)
+    if isinstance(value, pd.Series):
+        return round(value.memory_usage(index=True, deep=True) / 1024**2, 2)
+    return None
+
+
+### Establish a function to add a finished step to the run report
+# --> a step whose output has more rows than its largest input (such as a join that multiplied rows) is flagged
+#     with row_growth
+# --> memory is recorded as the process's resident memory before and after the step, how far the step raised the
+#     peak, and the size of the tables going in and out
+def record(name, before, inputs, output, **info):
+    after = snapshot()
+    rows_in = [rows for rows in map(_rows, inputs) if rows is not None]
+    rows_out = _rows(output)
+    step = {'step': name, 'stage': before['stage'],
+            'wall_seconds': round(after['wall'] - before['wall'], 4),
+            'cpu_seconds': round(after['cpu'] - before['cpu'], 4),
+            'rss_before_mb': None if before['rss_now'] is None else round(before['rss_now'], 1),
+            'rss_after_mb': None if after['rss_now'] is None else round(after['rss_now'], 1),
+            'peak_rss_delta_mb': None if after['rss'] is None else round(after['rss'] - before['rss'], 1),
+            'table_mb_in': [mb for mb in map(_table_mb, inputs) if mb is not None], 'table_mb_out': _table_mb(output),
+            'rows_in': rows_in, 'rows_out': rows_out,
+            'row_growth': bool(rows_in and rows_out is not None and rows_out > max(rows_in))}
+    step.update(info)
+    with _lock:
+        _steps.append(step)
+
+
+### Establish a function to run one step of a stage and record it in the run report
+def track(name, func, *args, **kwargs):
+    before = snapshot()
+    result = func(*args, **kwargs)
+    record(name, before, list(args) + list(kwargs.values()), result)
+    return result
+
+
+### Establish functions to mark the stage the current thread is running, so its steps are grouped under it
+def enter_stage(name):
+    previous = getattr(_current, 'stage', None)
+    _current.stage = name
+    return previous
+
+
+def exit_stage(previous):
+    _current.stage = previous
+
+
+### Establish a function to write the run report as JSON
+# --> one file per run, named after the script and its start time, so runs can be compared over time
+def write_report(report_dir, script, settings=None):
+    os.makedirs(report_dir, exist_ok=True)
+    with _lock:
+        steps = list(_steps)
+    report = {'script': script, 'started': _started['at'],
+              'wall_seconds': round(time.time() - _started['time'], 3),
+              'peak_rss_mb': _peak_rss(), 'settings': settings or {},
+              'row_growth_steps': [step['step'] for step in steps if step['row_growth']],
+              'steps': steps}
+    path = os.path.join(report_dir, f"{script}-{_started['at'].replace(':', '')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
@@ -0,0 +1,127 @@
+## Risk Score Calculation
+
+### Import Necessary Packages
+import numpy as np
+import pandas as pd
+
+### Names of the risk scores in the order they are added to the risk dataset
+SCORES = ['poaf', 'chads', 'afri', 'npoaf', 'simplified', 'comaf']
+
+
+### Establish a function to pull a column as a float array (missing values become NaN so every comparison is False)
+def _num(df, col):
+    return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64')
+
+
+### Establish a function to pull a 0/1 indicator column as an int8 array
+# --> integer and bool columns (the risk dataset's uint8 indicators) are compared as they are, without a float copy
+def _flag(df, col):
+    values = df[col]
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iub':
+        return (values.to_numpy() == 1).astype('int8')
+    return (_num(df, col) == 1).astype('int8')
+
+
+### Establish a function to turn a boolean condition into an int8 array (every score fits in int8)
+def _int(cond):
+    return cond.astype('int8')
+
+
+### Establish a function to calculate all six risk scores in one columnar pass over the indicators table
+# --> each rule mirrors the row-wise score definitions (Cameron et al., 2018; Tran et al., 2015;
+#     Chen et al., 2018; Burgos et al., 2021) and returns one int8 column per score
+def calc_scores(df):
+    # --> pull every input column once
+    age = _num(df, 'age')
+    weight = _num(df, 'weight')
+    height = _num(df, 'height')
+    egfr = _num(df, 'eGFR')
+    gender = df['gender'].to_numpy(dtype=object)
+    male = _int(gender == 'M')
+    female = _int(gender == 'F')
+    chf = _flag(df, 'chf')
+    hbp = _flag(df, 'hbp')
+    dm = _flag(df, 'dm')
+    stroke = _flag(df, 'stroke')
+    pvd = _flag(df, 'pvd')
+    lad = _flag(df, 'lad')
+    mmvd = _flag(df, 'mmvd')
+    smvd = _flag(df, 'smvd')
+    copd = _flag(df, 'copd')
+    iabp = _flag(df, 'iabp')
+    cvas = _flag(df, 'cvas')
+    emergency = _flag(df, 'emergency')
+    dialysis = _flag(df, 'dialysis')
+    mi = _flag(df, 'MI')
+
+    # --> shared age bands
+    age_60_69 = _int((age >= 60) & (age <= 69))
+    age_65_74 = _int((age >= 65) & (age <= 74))
+    age_70_79 = _int((age >= 70) & (age <= 79))
+    age_65 = _int(age >= 65)
+    age_75 = _int(age >= 75)
+    age_80 = _int(age >= 80)
+
+    # --> POAF (Cameron et al., 2018)
+    poaf = (age_60_69 + 2*age_70_79 + 3*age_80 + copd
+            + _int((egfr < 15) | (dialysis == 1)) + emergency + iabp + cvas)
+    # --> CHADS (Cameron et al., 2018)
+    chads = chf + hbp + 2*age_75 + dm + 2*stroke + pvd + age_65_74 + female
+    # --> AFRI (Cameron et al., 2018)
+    afri = (male*(_int(age > 60) + _int(weight > 76) + _int(height > 176) + pvd)
+            + female*(_int(age > 66) + _int(weight > 64) + _int(height > 168) + pvd))
+    # --> NPOAF (Tran et al., 2015)
+    npoaf = 2*age_65_74 + 3*age_75 + mmvd + 3*smvd + lad
+    # --> Simplified POAF (Chen et al., 2018)
+    simplified = 2*age_65 + 2*hbp + mi + 2*chf
+    # --> COM-AF (Burgos et al., 2021)
+    comaf = age_65_74 + 2*age_75 + female + hbp + dm + 2*stroke
+
+    scores = {'poaf': poaf, 'chads': chads, 'afri': afri,
+              'npoaf': npoaf, 'simplified': simplified, 'comaf': comaf}
+    return pd.DataFrame({name: np.asarray(scores[name], dtype='int8') for name in SCORES},
+                        index=df.index)
+
+
+### Cut points at or above which a score is flagged as high risk (shown in crimson on the dashboard)
+CUT_POINTS = {'afri': 2, 'chads': 4, 'poaf': 3, 'npoaf': 2, 'simplified': 3, 'comaf': 3}
+
+### Highest value calc_scores can give each score (every rule met, in the highest age band that counts)
+SCORE_MAX = {'afri': 4, 'chads': 9, 'poaf': 8, 'npoaf': 8, 'simplified': 7, 'comaf': 7}
+
+### Map the dashboard form checklist values to the indicator columns used by calc_scores
+CONDITIONS = {'copd': 'copd', 'hbp': 'hbp', 'dm': 'dm', 'chf': 'chf', 'stroke': 'stroke', 'pvd': 'pvd',
+              'vd': 'vd', 'lad': 'lad', 'mmvd': 'mmvd', 'smvd': 'smvd', 'mi': 'MI'}
+PROCEDURES = {'iabp': 'iabp', 'cvas': 'cvas', 'dialysis': 'dialysis'}
+
+
+### Establish a function to calculate all six risk scores for a single patient entered on the dashboard form
+# --> missing form values behave like missing values in the indicators table (the rule is not met)
+def patient_scores(age, gender, weight, height, eGFR, emergency, conditions, procedures):
+    conditions = conditions or []
+    procedures = procedures or []
+    row = {'age': age, 'gender': gender, 'weight': weight, 'height': height, 'eGFR': eGFR,
+           'emergency': int(1 in (emergency or []))}
+    row.update({col: int(value in conditions) for value, col in CONDITIONS.items()})
+    row.update({col: int(value in procedures) for value, col in PROCEDURES.items()})
+    scores = calc_scores(pd.DataFrame([row]))
+    return {name: int(scores[name].iloc[0]) for name in SCORES}
+
+
+### Establish a function to summarize a reference dataset into a compact percentile lookup
+# --> for each score: the distinct score levels and how many reference patients sit at each level
+def percentile_lookup(df):
+    lookup = {'total': len(df)}
+    for name in SCORES:
+        if name in df:
+            counts = df[name].value_counts().sort_index()
+            lookup[name] = {'levels': counts.index.tolist(), 'counts': counts.astype(int).tolist()}
+    return lookup
+
+
+### Establish a function to calculate a patient's percentile (share of reference patients with a lower score)
+def percentile(lookup, name, val):
+    if val is None or name not in lookup or lookup['total'] == 0:
+        return None
+    n_less = sum(count for level, count in zip(lookup[name]['levels'], lookup[name]['counts']) if level < val)
+    return round((n_less/lookup['total'])*100)
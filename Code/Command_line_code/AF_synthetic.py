@@ -0,0 +1,168 @@
+## Synthetic MIMIC-III and MIMIC-Extract Data for Development and Benchmarks
+
+### Import Necessary Packages
+import argparse
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from AF_indicators import DIAGNOSIS_CODES, PROCEDURE_CODES
+
+### Shape of the synthetic cohort
+# --> share of admissions with a CABG procedure code (the cohort AF_process.py selects)
+CABG_SHARE = 0.5
+CABG_CODES = [3610, 3611, 3612, 3613, 3614, 3615, 3616, 3617, 3619]
+# --> share of admissions carrying each diagnosis or procedure indicator
+PREVALENCE = {'chf': 0.3, 'hbp': 0.5, 'dm': 0.3, 'stroke': 0.03, 'vd': 0.2, 'pvd': 0.1, 'lad': 0.05, 'mvd': 0.15,
+              'copd': 0.06, 'MI': 0.2, 'AF': 0.3, 'iabp': 0.05, 'cvas': 0.1, 'dialysis': 0.04}
+# --> codes that match no indicator
+OTHER_DIAGNOSES = ['5849', '2724', 'V4581', 'E8782', '2859', '2720', '5180', '2851', '53081', '3051']
+OTHER_PROCEDURES = [3961, 3722, 8856, 3761, 3812, 3734, 9604, 9671, 3893, 9904]
+# --> sentences the notes are made of, and the valve findings the note phrases look for
+NOTE_FILLER = ['Patient tolerated the procedure well and was transferred to the CVICU in stable condition.',
+               'Chest tubes were removed on postoperative day two.',
+               'The patient was seen by physical therapy and cleared for discharge home.',
+               'Ejection fraction was estimated at 45 percent on the preoperative echo.']
+NOTE_FINDINGS = ['mild mitral regurgitation', 'moderate mitral regurgitation', 'severe mitral stenosis',
+                 'no valvular abnormality']
+# --> MIMIC-Extract items written to the vitals_labs_mean table, with the mean and spread of each
+VITALS = {'heart rate': (80, 12), 'height': (170, 10), 'weight': (82, 16), 'creatinine': (1.1, 0.35),
+          'glucose': (130, 30), 'hemoglobin': (11, 1.5)}
+
+
+### Establish a function to append a chunk to a gzip-compressed csv (each chunk is a gzip member pandas reads through)
+# --> the fastest compression level, since compressing the notes dominates the time to write large datasets
+def _append(df, path, first):
+    df.to_csv(path, mode='w' if first else 'a', header=first, index=False,
+              compression={'method': 'gzip', 'compresslevel': 1})
+
+
+### Establish a function to draw the codes of one indicator for the admissions that carry it
+def _indicator_rows(rng, hadm, subject, share, codes):
+    hit = rng.random(len(hadm)) < share
+    return pd.DataFrame({'SUBJECT_ID': subject[hit], 'HADM_ID': hadm[hit],
+                         'ICD9_CODE': np.asarray(codes, dtype=object)[rng.integers(0, len(codes), hit.sum())]})
+
+
+### Establish a function to build the diagnosis or procedure rows of a chunk of admissions
+def _code_rows(rng, hadm, subject, code_sets, other, n_other):
+    parts = [_indicator_rows(rng, hadm, subject, PREVALENCE[name], codes) for name, codes in code_sets.items()]
+    parts.append(pd.DataFrame({'SUBJECT_ID': np.repeat(subject, n_other), 'HADM_ID': np.repeat(hadm, n_other),
+                               'ICD9_CODE': np.asarray(other, dtype=object)[rng.integers(0, len(other), len(hadm) * n_other)]}))
+    rows = pd.concat(parts, ignore_index=True).sort_values(['HADM_ID'], kind='stable')
+    rows.insert(2, 'SEQ_NUM', rows.groupby('HADM_ID').cumcount() + 1)
+    return rows
+
+
+### Establish a function to write a synthetic MIMIC-III / MIMIC-Extract dataset under root
+# --> writes root/Data/MIMIC-III/{PROCEDURES_ICD,DIAGNOSES_ICD,ADMISSIONS,PATIENTS,NOTEEVENTS}.csv.gz with the
+#     columns the pipeline reads, and root/Data/MIMIC-Extract/all_hourly_data.h5 with a vitals_labs_mean table in
+#     the MIMIC-Extract layout (row index subject_id/hadm_id/icustay_id/hours_in, columns LEVEL2/Aggregation Function)
+# --> the csv files are written chunk_size admissions at a time; the HDF5 table is written in one piece because
+#     the fixed format MIMIC-Extract uses cannot be appended to (about 50 bytes per admission-hour and item)
+def generate_mimic(root, n_admissions, seed=0, hours=6, notes_per_admission=2, note_sentences=20,
+                   chunk_size=500000):
+    rng = np.random.default_rng(seed)
+    mimic, extract = os.path.join(root, 'Data', 'MIMIC-III'), os.path.join(root, 'Data', 'MIMIC-Extract')
+    os.makedirs(mimic, exist_ok=True)
+    os.makedirs(extract, exist_ok=True)
+    os.makedirs(os.path.join(root, 'Code', 'Command_line_code'), exist_ok=True)
+    path = {name: os.path.join(mimic, name + '.csv.gz')
+            for name in ['PROCEDURES_ICD', 'DIAGNOSES_ICD', 'ADMISSIONS', 'PATIENTS', 'NOTEEVENTS']}
+
+    next_subject, rows_written = 100, {name: 0 for name in path}
+    vitals = []
+    for start in range(0, n_admissions, chunk_size):
+        n = min(chunk_size, n_admissions - start)
+        first = start == 0
+        hadm = np.arange(start, start + n, dtype='int64') + 100000
+        # --> about four admissions for every three subjects, each subject's admissions next to each other
+        new_subject = rng.random(n) < 0.75
+        new_subject[0] = True
+        subject = next_subject + np.cumsum(new_subject) - 1
+        next_subject = subject[-1] + 1
+        subjects = np.unique(subject)
+
+        # --> patients: gender and date of birth, shifted by 300 years for those older than 89 (as MIMIC-III does)
+        age = rng.integers(25, 96, len(subjects))
+        birth_year = 2150 - age
+        birth_year = np.where(age > 89, birth_year - 300, birth_year)
+        patients = pd.DataFrame({'ROW_ID': rows_written['PATIENTS'] + np.arange(len(subjects)), 'SUBJECT_ID': subjects,
+                                 'GENDER': rng.choice(['M', 'F'], len(subjects), p=[0.7, 0.3]),
+                                 'DOB': pd.Series(birth_year).astype(str) + '-01-01T00:00:00',
+                                 'EXPIRE_FLAG': (rng.random(len(subjects)) < 0.1).astype('int64')})
+        _append(patients, path['PATIENTS'], first)
+
+        # --> admissions in 2150 +/- 1 year
+        year = 2150 + rng.integers(-1, 2, n)
+        month, day = rng.integers(1, 13, n), rng.integers(1, 29, n)
+        admittime = pd.Series([f'{y}-{m:02d}-{d:02d}T08:00:00' for y, m, d in zip(year, month, day)])
+        admissions = pd.DataFrame({'ROW_ID': rows_written['ADMISSIONS'] + np.arange(n), 'SUBJECT_ID': subject,
+                                   'HADM_ID': hadm, 'ADMITTIME': admittime,
+                                   'ADMISSION_TYPE': rng.choice(['EMERGENCY', 'ELECTIVE', 'URGENT'], n, p=[0.6, 0.3, 0.1])})
+        _append(admissions, path['ADMISSIONS'], first)
+
+        # --> procedures: a CABG code for the cohort, the procedure indicators, and unrelated procedures
+        procedures = _code_rows(rng, hadm, subject, {name: [int(code) for code in codes]
+                                                     for name, codes in PROCEDURE_CODES.items()}, OTHER_PROCEDURES, 2)
+        cabg = rng.random(n) < CABG_SHARE
+        cabg_rows = pd.DataFrame({'SUBJECT_ID': subject[cabg], 'HADM_ID': hadm[cabg], 'SEQ_NUM': 0,
+                                  'ICD9_CODE': rng.choice(CABG_CODES, cabg.sum())})
+        procedures = pd.concat([cabg_rows, procedures], ignore_index=True).sort_values('HADM_ID', kind='stable')
+        procedures['SEQ_NUM'] = procedures.groupby('HADM_ID').cumcount() + 1
+        procedures.insert(0, 'ROW_ID', rows_written['PROCEDURES_ICD'] + np.arange(len(procedures)))
+        _append(procedures, path['PROCEDURES_ICD'], first)
+
+        # --> diagnoses: the diagnosis indicators and unrelated diagnoses
+        diagnoses = _code_rows(rng, hadm, subject, DIAGNOSIS_CODES, OTHER_DIAGNOSES, 5)
+        diagnoses.insert(0, 'ROW_ID', rows_written['DIAGNOSES_ICD'] + np.arange(len(diagnoses)))
+        _append(diagnoses, path['DIAGNOSES_ICD'], first)
+
+        # --> notes: one discharge summary per admission (a few marked as errors) and nursing notes
+        k = notes_per_admission
+        sentences = rng.integers(0, len(NOTE_FILLER), (n * k, note_sentences))
+        text = pd.Series([' '.join(NOTE_FILLER[i] for i in row) for row in sentences])
+        text = text + ' Echo showed ' + np.asarray(NOTE_FINDINGS, dtype=object)[rng.integers(0, len(NOTE_FINDINGS), n * k)] + '.'
+        category = np.tile(['Discharge summary'] + ['Nursing'] * (k - 1), n)
+        notes = pd.DataFrame({'ROW_ID': rows_written['NOTEEVENTS'] + np.arange(n * k),
+                              'SUBJECT_ID': np.repeat(subject, k), 'HADM_ID': np.repeat(hadm, k),
+                              'CATEGORY': category,
+                              'ISERROR': np.where(rng.random(n * k) < 0.01, 1.0, np.nan), 'TEXT': text})
+        _append(notes, path['NOTEEVENTS'], first)
+
+        # --> hourly vitals and labs for the ICU stays (most admissions), with most hours unmeasured
+        icu = rng.random(n) < 0.9
+        stay_hours = rng.integers(1, hours + 1, icu.sum())
+        rows = stay_hours.sum()
+        index = pd.MultiIndex.from_arrays([np.repeat(subject[icu], stay_hours), np.repeat(hadm[icu], stay_hours),
+                                           np.repeat(hadm[icu] + 200000, stay_hours),
+                                           np.concatenate([np.arange(h) for h in stay_hours]) if rows else []],
+                                          names=['subject_id', 'hadm_id', 'icustay_id', 'hours_in'])
+        values = np.column_stack([rng.normal(mean, sd, rows) for mean, sd in VITALS.values()])
+        values[rng.random(values.shape) < 0.6] = np.nan
+        vitals.append(pd.DataFrame(values, index=index))
+
+        for name, df in [('PATIENTS', patients), ('ADMISSIONS', admissions), ('PROCEDURES_ICD', procedures),
+                         ('DIAGNOSES_ICD', diagnoses), ('NOTEEVENTS', notes)]:
+            rows_written[name] += len(df)
+
+    vitals = pd.concat(vitals)
+    vitals.columns = pd.MultiIndex.from_product([list(VITALS), ['mean']], names=['LEVEL2', 'Aggregation Function'])
+    with warnings.catch_warnings():
+        # --> PyTables warns that 'Aggregation Function' is not a Python identifier, as it does for MIMIC-Extract
+        warnings.simplefilter('ignore')
+        vitals.to_hdf(os.path.join(extract, 'all_hourly_data.h5'), key='vitals_labs_mean', mode='w', format='fixed')
+    rows_written['vitals_labs_mean'] = len(vitals)
+    return rows_written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic MIMIC-III / MIMIC-Extract dataset')
+    parser.add_argument('root', help='directory to create Data/MIMIC-III and Data/MIMIC-Extract in')
+    parser.add_argument('--admissions', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--hours', type=int, default=6, help='longest ICU stay in hours')
+    args = parser.parse_args()
+
+    print(generate_mimic(args.root, args.admissions, args.seed, args.hours))
@@ -0,0 +1,118 @@
+// Clientside versions of the dashboard scoring callbacks (used when clientside_scoring = True in AF_dashboard.py)
+// The rules mirror calc_scores in AF_scores.py; keep the two files in sync. The cut points (CUT_POINTS) and score
+// maxima (SCORE_MAX) are not copied here: they come from AF_scores.py with the reference-lookup store.
+
+(function() {
+    var scoreNames = ['afri', 'chads', 'poaf', 'npoaf', 'simplified', 'comaf'];
+
+    // missing form values become NaN so every comparison is false (null would compare as 0)
+    function num(v) {
+        return (v === null || v === undefined || v === '') ? NaN : Number(v);
+    }
+
+    function has(list, value) {
+        return (list || []).indexOf(value) !== -1 ? 1 : 0;
+    }
+
+    function between(x, lo, hi) {
+        return (x >= lo && x <= hi) ? 1 : 0;
+    }
+
+    // Python's round() rounds halves to the nearest even number
+    function pyRound(x) {
+        var r = Math.round(x);
+        if (Math.abs(x % 1) === 0.5 && r % 2 !== 0) {
+            r -= 1;
+        }
+        return r;
+    }
+
+    function patientScores(age, gender, weight, height, egfr, emergency, conditions, procedures) {
+        age = num(age);
+        weight = num(weight);
+        height = num(height);
+        egfr = num(egfr);
+        var male = gender === 'M' ? 1 : 0;
+        var female = gender === 'F' ? 1 : 0;
+        var chf = has(conditions, 'chf'), hbp = has(conditions, 'hbp'), dm = has(conditions, 'dm');
+        var stroke = has(conditions, 'stroke'), pvd = has(conditions, 'pvd'), lad = has(conditions, 'lad');
+        var mmvd = has(conditions, 'mmvd'), smvd = has(conditions, 'smvd'), copd = has(conditions, 'copd');
+        var mi = has(conditions, 'mi');
+        var iabp = has(procedures, 'iabp'), cvas = has(procedures, 'cvas'), dialysis = has(procedures, 'dialysis');
+        var emerg = has(emergency, 1);
+
+        var age6069 = between(age, 60, 69), age6574 = between(age, 65, 74), age7079 = between(age, 70, 79);
+        var age65 = age >= 65 ? 1 : 0, age75 = age >= 75 ? 1 : 0, age80 = age >= 80 ? 1 : 0;
+
+        return {
+            poaf: age6069 + 2*age7079 + 3*age80 + copd + ((egfr < 15 || dialysis) ? 1 : 0) + emerg + iabp + cvas,
+            chads: chf + hbp + 2*age75 + dm + 2*stroke + pvd + age6574 + female,
+            afri: male*((age > 60 ? 1 : 0) + (weight > 76 ? 1 : 0) + (height > 176 ? 1 : 0) + pvd)
+                + female*((age > 66 ? 1 : 0) + (weight > 64 ? 1 : 0) + (height > 168 ? 1 : 0) + pvd),
+            npoaf: 2*age6574 + 3*age75 + mmvd + 3*smvd + lad,
+            simplified: 2*age65 + 2*hbp + mi + 2*chf,
+            comaf: age6574 + 2*age75 + female + hbp + dm + 2*stroke
+        };
+    }
+
+    function percentile(lookup, name, val) {
+        if (val === null || val === undefined || !lookup || !lookup[name] || lookup.total === 0) {
+            return null;
+        }
+        var nLess = 0;
+        for (var i = 0; i < lookup[name].levels.length; i++) {
+            if (lookup[name].levels[i] < val) {
+                nLess += lookup[name].counts[i];
+            }
+        }
+        return pyRound((nLess/lookup.total)*100);
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        af_scores: {
+            // same outputs as score_calc: card, card style, mini card, mini style per score, then the scores store
+            // (a score is shown in red from its cut point in the reference lookup, which is loaded with the page)
+            calc_scores: function(n_clicks, age, gender, weight, height, ef, egfr, emergency, conditions, procedures, lookup) {
+                var scores = n_clicks ? patientScores(age, gender, weight, height, egfr,
+                                                      emergency, conditions, procedures) : null;
+                var cutPoints = (lookup && lookup.cut_points) || {};
+                var outputs = [];
+                scoreNames.forEach(function(name) {
+                    var val = scores === null ? null : scores[name];
+                    var style = {textAlign: 'center', color: (val !== null && val >= cutPoints[name]) ? 'crimson' : 'slateblue'};
+                    outputs.push(val, style, val, style);
+                });
+                outputs.push(scores);
+                return outputs;
+            },
+
+            // same outputs as percentile_calc
+            percentiles: function(scores, lookup) {
+                return scoreNames.map(function(name) {
+                    var val = scores ? scores[name] : null;
+                    return ['Percentile: ', percentile(lookup, name, val), '%'];
+                });
+            },
+
+            // overlay the red patient marker on the strip chart built by the server
+            patient_marker: function(base, scores, xaxis, yaxis) {
+                if (!base) {
+                    return window.dash_clientside.no_update;
+                }
+                if (!scores) {
+                    return base;
+                }
+                var fig = Object.assign({}, base, {data: base.data.slice()});
+                fig.data.push({
+                    type: 'scatter',
+                    x: [scores[xaxis]],
+                    y: [scores[yaxis]],
+                    mode: 'markers',
+                    marker: {color: 'crimson'},
+                    showlegend: false
+                });
+                return fig;
+            }
+        }
+    });
+})();
@@ -0,0 +1,7 @@
+## Test Set-up
+
+### Import the processing and dashboard modules the way the scripts do (from Code/Command_line_code)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
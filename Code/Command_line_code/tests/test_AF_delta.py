@@ -0,0 +1,88 @@
+## Tests for the Incremental Processing in AF_delta.py
+
+### Import Necessary Packages
+import numpy as np
+import pandas as pd
+import pytest
+
+from AF_delta import delta_admissions, group_medians, median_counts, merge_counts, merge_delta
+
+
+### Establish a function to make per-admission vitals with repeated values, missing values, and groups of even size
+def _vitals(n, seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    hadm = np.arange(start, start + n) + 100000
+    vitals = pd.DataFrame({'SUBJECT_ID': hadm // 2, 'HADM_ID': hadm,
+                           'age_group': rng.integers(1, 4, n), 'GENDER': rng.choice(['M', 'F'], n),
+                           'height': rng.integers(150, 160, n).astype('float64'),
+                           'weight': rng.normal(80, 10, n).round(0)})
+    vitals.loc[rng.random(n) < 0.2, 'height'] = np.nan
+    vitals.loc[rng.random(n) < 0.2, 'weight'] = np.nan
+    return vitals
+
+
+### Establish a function to take the medians directly from the values (the full recompute)
+def _direct_medians(vitals):
+    medians = vitals.groupby(['age_group', 'GENDER'])[['height', 'weight']].median().reset_index()
+    return medians.sort_values(['age_group', 'GENDER']).reset_index(drop=True)
+
+
+def _medians(counts):
+    return group_medians(counts).sort_values(['age_group', 'GENDER']).reset_index(drop=True)[
+        ['age_group', 'GENDER', 'height', 'weight']]
+
+
+def test_medians_from_counts_match_the_values_including_even_counts():
+    for seed in range(5):
+        vitals = _vitals(200 + seed, seed=seed)
+        pd.testing.assert_frame_equal(_medians(median_counts(vitals)), _direct_medians(vitals), check_dtype=False)
+    # --> two values: the median is their mean
+    pair = pd.DataFrame({'age_group': [1, 1], 'GENDER': ['M', 'M'], 'height': [150.0, 161.0], 'weight': [70.0, 70.0]})
+    assert _medians(median_counts(pair))['height'].tolist() == [155.5]
+
+
+def test_added_admissions_match_a_full_recompute():
+    old, new = _vitals(300, seed=1), _vitals(80, seed=2, start=300)
+    counts = merge_counts(median_counts(old), add=median_counts(new))
+    pd.testing.assert_frame_equal(_medians(counts), _direct_medians(pd.concat([old, new])), check_dtype=False)
+
+
+def test_changed_admissions_match_a_full_recompute():
+    old = _vitals(300, seed=3)
+    changed = old.iloc[::7].copy()
+    changed['height'] = changed['height'] + 5
+    changed['weight'] = np.nan
+    counts = merge_counts(median_counts(old), add=median_counts(changed),
+                          remove=median_counts(old.loc[old['HADM_ID'].isin(changed['HADM_ID'])]))
+    full = merge_delta(old, changed, keys=['SUBJECT_ID', 'HADM_ID'])
+    pd.testing.assert_frame_equal(_medians(counts), _direct_medians(full), check_dtype=False)
+    # --> no count is left at zero or below
+    assert (counts['count'] > 0).all()
+
+
+def test_empty_delta_changes_nothing():
+    old = _vitals(150, seed=4)
+    empty = old.iloc[:0]
+    counts = merge_counts(median_counts(old), add=median_counts(empty), remove=median_counts(empty))
+    pd.testing.assert_frame_equal(counts, median_counts(old).reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(merge_delta(old, empty, keys=['SUBJECT_ID', 'HADM_ID']),
+                                  old.sort_values(['SUBJECT_ID', 'HADM_ID']).reset_index(drop=True))
+
+
+def test_merge_delta_replaces_and_adds_rows_like_a_full_recompute():
+    full = pd.DataFrame({'subject_id': [1, 1, 2, 3, 4], 'hadm_id': [10, 11, 20, 30, 40], 'score': [1, 2, 3, 4, 5]})
+    existing = full.iloc[:4].assign(score=[1, 9, 3, 9])
+    delta = full.loc[full['hadm_id'].isin([11, 30, 40])].iloc[::-1]
+    pd.testing.assert_frame_equal(merge_delta(existing, delta), full)
+
+
+def test_delta_admissions_takes_new_and_changed_admissions_and_their_subjects(tmp_path):
+    cabg = pd.DataFrame({'SUBJECT_ID': [1, 1, 2, 3, 3, 4], 'HADM_ID': [10, 11, 20, 30, 31, 40]}).astype('int32')
+    previous = pd.DataFrame({'subject_id': [1, 2, 3, 3], 'hadm_id': [10, 20, 30, 31]})
+    # --> admission 11 is new, so admission 10 of the same subject is processed again; 40 is new
+    assert delta_admissions(cabg, previous)['HADM_ID'].tolist() == [10, 11, 40]
+    changed = tmp_path / 'changed.csv'
+    pd.DataFrame({'HADM_ID': [20]}).to_csv(changed, index=False)
+    assert delta_admissions(cabg, previous, str(changed))['HADM_ID'].tolist() == [10, 11, 20, 40]
+    # --> nothing new or changed: an empty delta
+    assert delta_admissions(cabg, cabg.rename(columns=str.lower)).empty
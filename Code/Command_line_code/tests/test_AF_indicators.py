@@ -0,0 +1,83 @@
+## Tests for the ICD-9 Code Matching in AF_indicators.py
+
+### Import Necessary Packages
+import numpy as np
+import pandas as pd
+
+from AF_indicators import DIAGNOSIS_CODES, PROCEDURE_CODES, code_indicators, icd_strings, incidence_matrix, match_codes
+
+
+### Establish a function to match codes one at a time, as the original row-wise indicator code did
+def _rowwise(vocab, patterns):
+    def hit(code):
+        for p in patterns:
+            if p.endswith('*'):
+                if code.startswith(p[:-1]):
+                    return True
+            elif '-' in p:
+                lo, hi = p.split('-')
+                if len(code) >= len(lo) and lo <= code[:len(lo)] <= hi:
+                    return True
+            elif code == p:
+                return True
+        return False
+    return np.array([hit(code) for code in vocab])
+
+
+def test_exact_codes_do_not_match_longer_or_shorter_codes():
+    vocab = ['428', '4280', '42800', '4281', '42820', '4289']
+    assert match_codes(vocab, ['4280', '4281']).tolist() == [False, True, False, True, False, False]
+    assert match_codes(vocab, ['428']).tolist() == [True, False, False, False, False, False]
+
+
+def test_prefix_matches_every_code_that_starts_with_it():
+    vocab = ['428', '4280', '42820', '4289', '429', '24900', '1428']
+    assert match_codes(vocab, ['428*']).tolist() == [True, True, True, True, False, False, False]
+
+
+def test_range_includes_both_ends_and_longer_codes():
+    vocab = ['409', '4099', '410', '41000', '412', '4149', '41499', '415', '41', '4']
+    assert match_codes(vocab, ['410-414']).tolist() == [False, False, True, True, True, True, True, False, False, False]
+
+
+def test_mixed_patterns_match_like_the_rowwise_code():
+    vocab = ['4010', '4019', '25000', '2500', '250', '41000', '4149', '415', 'V1254', 'V125', '3961', '42731']
+    patterns = ['4010', '250*', '410-414', 'V1254', '427*']
+    assert match_codes(vocab, patterns).tolist() == _rowwise(vocab, patterns).tolist()
+
+
+def test_code_lists_have_no_duplicates():
+    for code_sets in (DIAGNOSIS_CODES, PROCEDURE_CODES):
+        for name, patterns in code_sets.items():
+            assert len(patterns) == len(set(patterns)), name
+
+
+def test_numeric_procedure_codes_become_matching_strings():
+    codes = icd_strings(pd.Series([3961, 3596, 3961, np.nan]))
+    assert codes.tolist()[:3] == ['3961', '3596', '3961']
+    assert pd.isna(codes.tolist()[3])
+
+
+def test_incidence_matrix_skips_missing_codes_and_admissions_outside_the_cohort():
+    codes = pd.DataFrame({'SUBJECT_ID': [1, 1, 2, 2, 3], 'HADM_ID': [10, 10, 20, 20, 30],
+                          'ICD9_CODE': ['4280', '42731', None, '4280', '4019']})
+    cohort = pd.DataFrame({'subject_id': [2, 1], 'hadm_id': [20, 10]})
+    matrix, vocab, ids = incidence_matrix(codes, cohort)
+    assert ids.values.tolist() == [[2, 20], [1, 10]]
+    dense = pd.DataFrame(matrix.toarray(), columns=vocab)
+    assert dense.loc[0, '4280'] == 1 and dense.loc[1, '4280'] == 1 and dense.loc[1, '42731'] == 1
+    assert dense.to_numpy().sum() == 3
+
+
+def test_code_indicators_match_a_rowwise_scan_of_every_code_list():
+    rng = np.random.default_rng(0)
+    pool = sorted({code for patterns in DIAGNOSIS_CODES.values() for code in patterns} | {'5849', '2724', 'V4581'})
+    codes = pd.DataFrame({'SUBJECT_ID': rng.integers(0, 50, 2000), 'ICD9_CODE': rng.choice(pool, 2000)})
+    codes['HADM_ID'] = codes['SUBJECT_ID'] + 1000
+    cohort = pd.DataFrame({'subject_id': np.arange(60), 'hadm_id': np.arange(60) + 1000})
+    flags = code_indicators(codes, cohort, DIAGNOSIS_CODES).set_index(['SUBJECT_ID', 'HADM_ID'])
+    for name, patterns in DIAGNOSIS_CODES.items():
+        hits = codes.loc[_rowwise(codes['ICD9_CODE'].tolist(), patterns)]
+        expected = cohort['subject_id'].isin(hits['SUBJECT_ID']).astype('uint8').tolist()
+        assert flags[name].tolist() == expected, name
+        assert flags[name].dtype == 'uint8'
@@ -0,0 +1,86 @@
+## Tests for Reading the MIMIC-Extract Vitals in AF_io.py
+
+### Import Necessary Packages
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+import AF_io
+from AF_io import read_vitals
+
+
+### Establish a function to write a vitals table in the MIMIC-Extract layout with DataFrame.to_hdf
+# --> rows subject_id/hadm_id/icustay_id/hours_in, columns LEVEL2/Aggregation Function with a mean and a count for
+#     each item (the counts are integers, so the fixed format stores them in a second block)
+def _write_extract(path, fmt='fixed', seed=0):
+    rng = np.random.default_rng(seed)
+    stays = rng.integers(1, 5, 40)
+    subjects = np.repeat(np.arange(40) * 3 + 7, stays)
+    index = pd.MultiIndex.from_arrays([subjects, subjects + 100000, subjects + 200000,
+                                       np.concatenate([np.arange(n) for n in stays])],
+                                      names=['subject_id', 'hadm_id', 'icustay_id', 'hours_in'])
+    items = ['heart rate', 'height', 'weight', 'creatinine']
+    means = pd.DataFrame(rng.normal(100, 20, (len(index), len(items))), index=index,
+                         columns=pd.MultiIndex.from_product([items, ['mean']]))
+    means = means.mask(rng.random(means.shape) < 0.5)
+    counts = pd.DataFrame(rng.integers(0, 4, (len(index), len(items))), index=index,
+                          columns=pd.MultiIndex.from_product([items, ['count']]))
+    extract = pd.concat([means, counts], axis=1)
+    extract.columns.names = ['LEVEL2', 'Aggregation Function']
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        extract.to_hdf(path, key='vitals_labs_mean', mode='w', format=fmt)
+    return extract
+
+
+def test_fixed_format_matches_pandas(tmp_path, monkeypatch):
+    path = str(tmp_path / 'all_hourly_data.h5')
+    _write_extract(path)
+    cohort = pd.DataFrame({'SUBJECT_ID': [31, 7, 10, 118, 9999], 'HADM_ID': [0, 0, 0, 0, 0]})
+    subjects = pd.unique(cohort['SUBJECT_ID'])
+    expected = AF_io._read_vitals_pandas(path, 'vitals_labs_mean', subjects, ('height', 'weight', 'creatinine'), 'mean')
+
+    # --> the file must be read through the HDF5 layout, not the pandas fallback
+    def fallback(*args, **kwargs):
+        raise AssertionError('read_vitals fell back to pandas for a fixed-format file')
+    monkeypatch.setattr(AF_io, '_read_vitals_pandas', fallback)
+    result = read_vitals(path, cohort)
+    pd.testing.assert_frame_equal(result, expected, check_names=False)
+    assert len(result) > 0 and set(result['subject_id']) == {7, 10, 31, 118}
+    assert result['subject_id'].dtype == 'int32' and result['hadm_id'].dtype == 'int32'
+
+
+def test_fixed_format_reads_other_items_and_aggregations(tmp_path):
+    path = str(tmp_path / 'all_hourly_data.h5')
+    extract = _write_extract(path, seed=1)
+    cohort = pd.DataFrame({'subject_id': extract.index.get_level_values('subject_id').unique()})
+    result = read_vitals(path, cohort, items=('heart rate', 'creatinine'), agg='count')
+    expected = extract.xs('count', axis=1, level=1)[['heart rate', 'creatinine']].reset_index()
+    assert result[['heart rate', 'creatinine']].to_numpy().tolist() == expected[['heart rate', 'creatinine']].to_numpy().tolist()
+    assert result['hadm_id'].tolist() == expected['hadm_id'].tolist()
+
+
+def test_table_format_matches_fixed_format(tmp_path):
+    # --> the table format cannot store MultiIndex columns, so the table file has one column per item (the means)
+    fixed, table = str(tmp_path / 'fixed.h5'), str(tmp_path / 'table.h5')
+    extract = _write_extract(fixed, seed=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        extract.xs('mean', axis=1, level=1).to_hdf(table, key='vitals_labs_mean', mode='w', format='table')
+    cohort = pd.DataFrame({'subject_id': [10, 13, 55]})
+    pd.testing.assert_frame_equal(read_vitals(table, cohort), read_vitals(fixed, cohort), check_names=False)
+
+
+def test_missing_item_is_reported(tmp_path):
+    path = str(tmp_path / 'all_hourly_data.h5')
+    _write_extract(path)
+    with pytest.raises(KeyError):
+        read_vitals(path, pd.DataFrame({'subject_id': [7]}), items=('height', 'glucose'))
+
+
+def test_cohort_outside_the_file_gives_no_rows(tmp_path):
+    path = str(tmp_path / 'all_hourly_data.h5')
+    _write_extract(path)
+    result = read_vitals(path, pd.DataFrame({'subject_id': [1, 2]}))
+    assert len(result) == 0 and list(result.columns) == ['subject_id', 'hadm_id', 'height', 'weight', 'creatinine']
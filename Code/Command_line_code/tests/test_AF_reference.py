@@ -0,0 +1,90 @@
+## Tests for the Reference Statistics in AF_reference.py
+
+### Import Necessary Packages
+import base64
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+import AF_reference
+from AF_reference import cached_reference_stats, cut_metrics, grouped_logit, level_counts, reference_stats, roc_table
+from AF_reference import store_upload, upload_data
+
+
+### Establish a function to make a fixed reference dataset: scores 0-6 with AF more likely at higher scores
+def _reference(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    score = rng.integers(0, 7, n)
+    af = (rng.random(n) < 1 / (1 + np.exp(-(score - 3) * 0.6))).astype(int)
+    df = pd.DataFrame({'chads': score.astype('float64'), 'AF': af})
+    df.loc[rng.random(n) < 0.05, 'chads'] = np.nan
+    return df
+
+
+### Establish a function to calculate the AUC from every pair of an AF and a non-AF patient (ties count half)
+def _pairwise_auc(score, af):
+    pos, neg = score[af == 1], score[af == 0]
+    return ((pos[:, None] > neg[None, :]).sum() + 0.5 * (pos[:, None] == neg[None, :]).sum()) / (len(pos) * len(neg))
+
+
+def test_grouped_logit_matches_statsmodels_on_one_row_per_patient():
+    df = _reference().dropna()
+    fit = grouped_logit(*level_counts(df['chads'], df['AF']))
+    assert fit is not None
+    beta, covariance = fit
+    reference = sm.Logit(df['AF'].to_numpy(), sm.add_constant(df['chads'].to_numpy())).fit(disp=0)
+    np.testing.assert_allclose(beta, reference.params, rtol=1e-8)
+    np.testing.assert_allclose(covariance, reference.cov_params(), rtol=1e-6)
+
+
+def test_roc_table_auc_and_cut_metrics_match_brute_force():
+    df = _reference(seed=1).dropna()
+    roc = roc_table(*level_counts(df['chads'], df['AF']))
+    score, af = df['chads'].to_numpy(), df['AF'].to_numpy()
+    assert roc['auc'] == pytest.approx(_pairwise_auc(score, af))
+    assert roc['positives'] == (af == 1).sum() and roc['negatives'] == (af == 0).sum()
+    # --> cut points between, at, below, and above the score levels
+    for cut in [-1, 0, 2, 2.5, 6, 7]:
+        flagged = score >= cut
+        assert cut_metrics(roc, cut) == {'TP': (flagged & (af == 1)).sum(), 'FP': (flagged & (af == 0)).sum(),
+                                         'FN': (~flagged & (af == 1)).sum(), 'TN': (~flagged & (af == 0)).sum()}
+
+
+def test_inestimable_odds_ratios_are_nan_without_an_error():
+    df = pd.DataFrame({'chads': [0, 0, 1, 3, 3, 4], 'afri': [2] * 6, 'AF': [0, 0, 0, 1, 1, 1]})
+    # --> chads separates the outcomes perfectly and afri has a single level
+    assert grouped_logit(*level_counts(df['chads'], df['AF'])) is None
+    assert grouped_logit(*level_counts(df['afri'], df['AF'])) is None
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        stats = reference_stats(df)
+    assert stats['errors'] == {}
+    for name in ['chads', 'afri']:
+        assert np.isnan(stats['scores'][name]['odds_ratio'])
+        assert all(np.isnan(stats['scores'][name]['ci']))
+    assert stats['scores']['chads']['roc']['auc'] == pytest.approx(1.0)
+    assert stats['scores']['afri']['roc']['auc'] == pytest.approx(0.5)
+
+
+def test_a_score_that_cannot_be_calculated_leaves_the_others():
+    df = _reference(seed=2).dropna()
+    df['afri'] = np.where(df['chads'] > 3, 'high', 'low')
+    with pytest.warns(UserWarning, match='afri'):
+        stats = reference_stats(df)
+    assert stats['scores']['afri'] is None and 'afri' in stats['errors']
+    assert stats['scores']['chads'] is not None and 'chads' not in stats['errors']
+
+
+def test_upload_statistics_are_calculated_when_stored_and_then_looked_up_by_token(monkeypatch):
+    df = _reference(seed=3)
+    contents = 'data:text/csv;base64,' + base64.b64encode(df.to_csv(index=False).encode()).decode()
+    token = store_upload(contents, 'reference.csv')
+    # --> neither the statistics nor their cache key are calculated again
+    def fail(*args, **kwargs):
+        raise AssertionError('recalculated')
+    monkeypatch.setattr(AF_reference, 'stage_key', fail)
+    monkeypatch.setattr(AF_reference, 'reference_stats', fail)
+    stats = cached_reference_stats(upload_data(token), data_key=token)
+    assert stats['lookup']['total'] == len(df) and stats['scores']['chads'] is not None
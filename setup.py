@@ -22,12 +22,17 @@ setuptools.setup(
                       'pandas',
                       'numpy',
                       'datetime',
-                      'dash >=1.20',
+                      'dash >=2.9',
                       'waitress',
                       'dash_bootstrap_components',
                       'dash_bootstrap_templates',
                       'plotly',
-                      'statsmodels'
+                      'statsmodels',
+                      'pyahocorasick',
+                      'scipy',
+                      'tables',
+                      'pyarrow',
+                      'openpyxl'
     ],
     packages=find_packages(
         where='src',